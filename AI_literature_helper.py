@@ -1,11 +1,17 @@
 import streamlit as st
-import requests, json, re, os, io
+import json, re, os, io
 import xml.etree.ElementTree as ET
 from pyzotero import zotero
-import fitz  # PyMuPDF
-from time import sleep
-from requests import RequestException
+from time import sleep, monotonic
 from datetime import datetime
+from collections import deque, Counter
+from itertools import chain
+from heapq import heappush, heappushpop
+from queue import Queue, Empty, Full
+from threading import Thread, Event, Lock, BoundedSemaphore, local
+from difflib import SequenceMatcher
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # ----------------------------
 # GEMINI (google-genai)
@@ -13,6 +19,15 @@ from datetime import datetime
 # pip install google-genai
 from google import genai
 
+from disk_cache import DiskCache, CACHE_DIR, cache_key
+from identity import IdentityResolver, normalize_doi, normalize_title
+import http_client
+import pdf_tools
+import prerank
+import prompt_budget
+from prompt_budget import estimate_tokens
+from zotero_index import ZoteroIndex
+
 # ============================
 # CONFIG
 # ============================
@@ -23,10 +38,32 @@ GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
 NCBI_EMAIL = st.secrets["NCBI_EMAIL"]
 NCBI_API_KEY = st.secrets["NCBI_API_KEY"]
 client = genai.Client(api_key=GEMINI_API_KEY)
+# Optional: duplicate API GETs still unanswered after N seconds (trades a little quota for tail latency)
+HEDGE_AFTER = float(st.secrets.get("HEDGE_AFTER_SECONDS", 0) or 0) or None
+http_client.configure(ncbi_api_key=NCBI_API_KEY, mailto=NCBI_EMAIL, hedge_after=HEDGE_AFTER)
 
-SLEEP = 0.08  # pacing for retries/backoff
+PROVIDER_TIMEOUTS = {"Semantic Scholar": 30, "PubMed": 60}  # wall-clock budget per provider (s)
 PREFS_FILE = "prefs.json"
 
+# Gemini model per tier (override in secrets): cheap triage → full per-paper annotation → per-query scoring
+TRIAGE_MODEL = st.secrets.get("TRIAGE_MODEL", "gemini-2.5-flash-lite")
+ANNOTATION_MODEL = st.secrets.get("ANNOTATION_MODEL", "gemini-2.5-flash")
+SCORING_MODEL = st.secrets.get("SCORING_MODEL", "gemini-2.5-flash")
+ANNOTATION_CACHE_TTL = 30 * 24 * 3600         # per-query scores: re-score after 30 days
+PAPER_ANNOTATION_TTL = 180 * 24 * 3600        # per-paper abstract/tags do not depend on the query
+ANNOTATION_CACHE_MAX_BYTES = 64 * 1024 * 1024  # LRU-evicted beyond this
+
+@st.cache_resource
+def annotation_cache() -> DiskCache:
+    """Persistent Gemini annotation cache, shared by all sessions of this process."""
+    return DiskCache(os.path.join(CACHE_DIR, "annotations.sqlite"),
+                     ttl=ANNOTATION_CACHE_TTL, max_bytes=ANNOTATION_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def zotero_index(library_id: str, api_key: str) -> ZoteroIndex:
+    """Duplicate index of one Zotero library, shared by all sessions of this process (synced per run)."""
+    return ZoteroIndex(zotero.Zotero(library_id, 'user', api_key), library_id, api_key)
+
 # ============================
 # PREFERENCES (saved locally)
 # ============================
@@ -70,9 +107,26 @@ max_results = st.slider("📄 Max articles to fetch:", 5, 100, 20, 1)
 # Unified relevance is score3 (0..3)
 min_score3 = st.slider("⭐ Minimum AI relevance score3 to save to Zotero (0–3):", 0, 3, 2, 1)
 
+deep_retrieval, max_candidates = False, max_results
+use_prerank, prerank_top_k, prerank_cutoff = False, max_results, 0.0
 if search_mode == "Keyword Search":
     user_prompt = st.text_input("🔍 Enter your research topic or keywords:")
     use_boolean = st.checkbox("🔤 Convert to Boolean query (AI-optimized)")
+    deep_retrieval = st.checkbox("🌊 Deep retrieval (page through thousands of results)",
+                                 help="Systematic-review mode: pages stream in and are annotated while later ones load "
+                                      "(with pre-ranking, once all pages are ranked).")
+    if deep_retrieval:
+        max_candidates = int(st.number_input("Max candidates", 100, 10000, 1000, 100))
+    # off by default: with deep retrieval it holds annotation back until every page has been fetched and ranked
+    use_prerank = st.checkbox("🎯 Local pre-ranking (only the best lexical matches go to Gemini)",
+                              help="BM25 over title + abstract, boosted by your priority topics/authors. "
+                                   "Free and instant. With deep retrieval, annotation starts only once all pages "
+                                   "are ranked.")
+    if use_prerank:
+        col_k, col_cut = st.columns(2)
+        prerank_top_k = int(col_k.number_input("Send top K to Gemini", 1, 1000, 50, 5))
+        prerank_cutoff = col_cut.slider("Min local score (0–1)", 0.0, 1.0, 0.1, 0.05,
+                                        help="1 = every query term matched strongly; priority boosts can push above 1.")
 elif search_mode == "Paste citation / page text":
     paste_text = st.text_area("📋 Paste citation(s) or Google Scholar results / page text:", height=220)
 else:
@@ -87,15 +141,41 @@ with st.sidebar:
                    [a.strip() for a in authors_txt.split(",") if a.strip()])
         st.sidebar.success("Saved preferences.")
 
+    st.header("⚙️ Performance")
+    annotation_workers = st.slider("⚡ Parallel workers (PDF + AI)", 1, 16, 6, 1,
+                                   help="Papers downloaded, parsed and annotated at the same time.")
+    allow_partial = st.checkbox("⏱️ Go ahead with partial results", value=False,
+                                help="With 'Both' sources, stop waiting for a slow provider after the deadline.")
+    partial_deadline = st.slider("Provider deadline (s)", 3, 60, 15, 1, disabled=not allow_partial)
+    use_cascade = st.checkbox("🪜 Triage with a cheap model first", value=True,
+                              help=f"{TRIAGE_MODEL} scores title + abstract; only papers at or above the threshold "
+                                   f"(or your Zotero threshold) get the PDF + full {ANNOTATION_MODEL} annotation.")
+    full_annotation_from = st.slider("Full annotation from score3 ≥", 0, 3, 2, 1, disabled=not use_cascade)
+    batch_gemini = st.checkbox("📦 Batch Gemini requests", value=True,
+                               help="Several papers per request: far fewer calls under RPM quotas, "
+                                    "first results appear a little later.")
+
+    cache_stats = annotation_cache().stats()
+    st.caption(f"🗃️ Annotation cache: {cache_stats['entries']} entries "
+               f"({cache_stats['bytes'] / 1e6:.1f} MB), {cache_stats['hits']} hits · {cache_stats['misses']} misses")
+    pdf_stats = pdf_tools.cache_stats()["pdf"]
+    st.caption(f"📄 PDF cache: {pdf_stats['entries']} files ({pdf_stats['bytes'] / 1e6:.1f} MB)")
+    if st.button("🧹 Clear annotation cache"):
+        annotation_cache().clear()
+        st.sidebar.success("Annotation cache cleared.")
+
 add_to_zotero = st.checkbox("📥 Add articles to Zotero")
 user_zotero_key = user_zotero_id = user_zotero_collection = ""
-allow_duplicates = False
+allow_duplicates = attach_pdfs = False
 if add_to_zotero:
     st.markdown("### 🔐 Zotero Credentials")
     user_zotero_key = st.text_input("Zotero API Key")
     user_zotero_id = st.text_input("Zotero User ID")
     user_zotero_collection = st.text_input("Zotero Collection ID")
     allow_duplicates = st.checkbox("⚠️ Allow Zotero duplicates", value=False)
+    attach_pdfs = st.checkbox("📎 Attach downloaded PDFs", value=False,
+                              help="Uploads the PDF already fetched for annotation as a child attachment "
+                                   "(skipped when the library already stores the same file).")
 
 # ============================
 # HELPERS
@@ -123,20 +203,26 @@ def with_ntu_proxy(url: str | None, style: int = 2) -> str | None:
     return f"https://remotexs.ntu.edu.sg/login?url={url}"
 
 def extract_pdf_text(url: str) -> str:
-    """Download a PDF and return the first ~5000 chars of text, or empty string if fails."""
+    """Download a PDF and return its abstract/introduction/conclusion (~8000 chars, trimmed per prompt), or "" (cached)."""
     if not url:
         return ""
     try:
-        r = requests.get(url, timeout=45)
-        r.raise_for_status()
-        with fitz.open(stream=io.BytesIO(r.content), filetype="pdf") as doc:
-            text = []
-            for page in doc:
-                text.append(page.get_text())
-            return ("\n".join(text))[:5000]
+        return pdf_tools.fetch_pdf_sections(url, limit=pdf_tools.TEXT_CHARS)[1]
     except Exception:
         return ""
 
+def paper_pdf_text(paper: dict) -> str:
+    """
+    PDF text for a paper's prompt (abstract/introduction/conclusion, like extract_pdf_text); a PDF that URL lookup
+    already downloaded is read by content hash (pdf_sha) instead of by URL, so it is not fetched again.
+    """
+    if paper.get("pdf_sha"):
+        try:
+            return pdf_tools.pdf_sections_for(paper["pdf_sha"], limit=pdf_tools.TEXT_CHARS)
+        except Exception:
+            return ""
+    return extract_pdf_text(paper.get("pdf_url") or paper.get("url"))
+
 def parse_authors(authors_info: str):
     authors = [a.strip() for a in authors_info.split(",") if a.strip()]
     out = []
@@ -148,34 +234,149 @@ def parse_authors(authors_info: str):
             out.append({"creatorType": "author", "name": nm})
     return out
 
-def dedupe_results(results):
-    seen, out = set(), []
-    for r in results:
-        doi = (r.get("doi") or "").lower().replace("https://doi.org/", "")
-        key = doi or (r.get("url") or r.get("title", "")).lower()
-        if key in seen:
-            continue
-        seen.add(key); out.append(r)
-    return out
+ZOTERO_BATCH = 50      # items per create_items request (Zotero's write limit)
+ZOTERO_RETRIES = 2     # extra attempts for items that failed with a retryable error
 
-def _request_json_with_retries(url, *, method="GET", headers=None, params=None, data=None, tries=4, timeout=40):
-    delay = SLEEP
-    for attempt in range(1, tries + 1):
+def zotero_create_batched(zot, items: list[dict], batch: int = ZOTERO_BATCH, retries: int = ZOTERO_RETRIES,
+                          index: ZoteroIndex | None = None):
+    """
+    Create `items` in batches of up to `batch` per request, reading Zotero's per-item multi-status result.
+    Items that failed on a conflict/rate limit/server error are retried. A request that raised may still
+    have been written, so its items are only retried once a fresh `index` sync shows they are not in the
+    library (items it does show count as created); without an index they are not retried.
+    Returns ({index: created item {"key", "data"}}, {index: error message}, number of requests).
+    """
+    created, errors, requests = {}, {}, 0
+    pending, unsure = list(range(len(items))), []
+    before = set()  # library items that existed before this write: never mistaken for ours
+    if index is not None:
         try:
-            resp = (requests.post(url, headers=headers, params=params, data=data, timeout=timeout)
-                    if method == "POST" else
-                    requests.get(url, headers=headers, params=params, timeout=timeout))
-            if 200 <= resp.status_code < 300:
-                return resp.json()
-            if 500 <= resp.status_code < 600:
-                raise RequestException(f"Server {resp.status_code}")
-            resp.raise_for_status()
+            index.sync()
+            before = index.keys()
         except Exception:
-            if attempt == tries:
-                raise
-            sleep(delay)
-            delay = min(delay * 2, 3.0)
-    return {}
+            index = None
+    for attempt in range(retries + 1):
+        if attempt:
+            sleep(2 ** (attempt - 1))
+            pending += _zotero_not_created(items, unsure, created, errors, index, before)
+            unsure = []
+        retry = []
+        for start in range(0, len(pending), batch):
+            chunk = pending[start:start + batch]
+            requests += 1
+            try:
+                resp = zot.create_items([items[i] for i in chunk])
+            except Exception as e:
+                errors.update((i, str(e)) for i in chunk)
+                unsure += chunk
+                continue
+            for pos, saved in resp.get("successful", {}).items():
+                created[chunk[int(pos)]] = saved
+                errors.pop(chunk[int(pos)], None)
+            for pos, key in {**resp.get("unchanged", {}), **resp.get("success", {})}.items():
+                if chunk[int(pos)] not in created:
+                    created[chunk[int(pos)]] = {"key": key, "data": items[chunk[int(pos)]]}
+                    errors.pop(chunk[int(pos)], None)
+            for pos, fail in resp.get("failed", {}).items():
+                i = chunk[int(pos)]
+                errors[i] = f"{fail.get('code', '?')}: {fail.get('message', 'failed')}"
+                if fail.get("code") in (409, 412, 429) or int(fail.get("code") or 500) >= 500:
+                    retry.append(i)
+        pending = retry
+        if not pending and not unsure:
+            break
+    else:
+        _zotero_not_created(items, unsure, created, errors, index, before)  # out of attempts: pick up what was written
+    return created, errors, requests
+
+def _zotero_not_created(items: list[dict], unsure: list[int], created: dict, errors: dict,
+                        index: ZoteroIndex | None, before: set[str]) -> list[int]:
+    """
+    Of the items whose create request raised, those the library provably lacks (safe to send again).
+    Items a fresh index sync finds among the items new since `before` (by DOI, else by title) are moved
+    to `created`; without an index (or if the sync fails) none are.
+    """
+    if not unsure or index is None:
+        return []
+    try:
+        index.sync()
+    except Exception:
+        return []
+    retry, taken = [], {c["key"] for c in created.values()}
+    for i in unsure:
+        key = next(iter(sorted(index.matches(items[i].get("title"), items[i].get("DOI")) - before - taken)), None)
+        if key:
+            taken.add(key)
+            created[i] = {"key": key, "data": items[i]}
+            errors.pop(i, None)
+        else:
+            retry.append(i)
+    return retry
+
+ZOTERO_UPLOAD_WORKERS = 4   # concurrent attachment uploads
+
+def zotero_attach_pdfs(new_client, uploads, index: ZoteroIndex | None = None, workers: int = ZOTERO_UPLOAD_WORKERS):
+    """
+    Upload already-downloaded PDFs as child attachments; `uploads` is [(parent item key, PDF url)].
+    Bytes come from the PDF cache (never downloaded again); a file whose md5 the library already stores,
+    or that appears earlier in `uploads`, is skipped. Each upload thread uses its own new_client().
+    Returns {parent key: "attached" | "duplicate" | "not downloaded" | error message}.
+    """
+    out, todo, seen = {}, [], set()
+    for parent, url in uploads:
+        hit = pdf_tools.cached_pdf(url)
+        if not hit:
+            out[parent] = "not downloaded"
+            continue
+        path, md5 = hit
+        if md5 in seen or (index and index.has_file(md5)):
+            out[parent] = "duplicate"
+            continue
+        seen.add(md5)
+        todo.append((parent, path, md5))
+
+    clients = local()
+
+    def upload(parent, path, md5):
+        if not hasattr(clients, "zot"):
+            clients.zot = new_client()
+        res = clients.zot.attachment_both([("Full Text PDF", path)], parentid=parent)
+        done = res.get("success", []) + res.get("unchanged", [])
+        if not done:
+            raise RuntimeError((res.get("failure") or [{}])[0].get("error", "upload failed"))
+        if index:
+            index.add_file(done[0]["key"], md5)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(upload, *job): job[0] for job in todo}
+        for fut, parent in futures.items():
+            try:
+                fut.result()
+                out[parent] = "attached"
+            except Exception as e:
+                out[parent] = str(e)
+    return out
+
+def paper_identity(title: str | None, doi: str | None) -> str:
+    """Stable paper key: normalized DOI when known, else normalized title."""
+    doi = normalize_doi(doi)
+    return f"doi:{doi}" if doi else f"title:{normalize_title(title)}"
+
+def dedupe_results(results, resolver: IdentityResolver | None = None):
+    """Drop cross-source duplicates (same DOI/PMID/URL or near-identical title), merged into the first copy."""
+    return (resolver or IdentityResolver()).extend(results)
+
+def iter_unique_pages(pages, limit: int, resolver: IdentityResolver | None = None):
+    """Drop duplicates from pages as they stream in (merged, see dedupe_results); stops after `limit` unique papers."""
+    resolver = resolver or IdentityResolver()
+    n = 0
+    for page in pages:
+        page = resolver.extend(page)[:limit - n]
+        n += len(page)
+        if page:
+            yield page
+        if n >= limit:
+            return
 
 def _chunks(seq, n):
     for i in range(0, len(seq), n):
@@ -197,15 +398,53 @@ def clean_snippet(text: str) -> str:
 # ============================
 # GEMINI (Boolean, extraction, annotation)
 # ============================
-def gemini_json(prompt: str, model: str = "gemini-2.5-flash") -> dict | list:
+_gemini_usage = Counter()
+_gemini_usage_lock = Lock()
+_prompt_log = deque(maxlen=1000)  # one entry per Gemini request, newest last
+
+def gemini_prompt_log() -> list[dict]:
+    """Recent requests: {t, stage, model, papers, est_tokens, prompt_tokens} (estimated vs. billed input tokens)."""
+    with _gemini_usage_lock:
+        return list(_prompt_log)
+
+def gemini_usage() -> dict:
+    """
+    Cumulative Gemini usage per stage: "<stage>.calls", "<stage>.papers" (papers covered by those calls),
+    "<stage>.tokens" (prompt + output + thinking), "<stage>.seconds", "<stage>.est_tokens" (prompt estimate),
+    plus "annotate.fitted" (paper blocks built) and "annotate.field.<name>": estimated tokens per paper-text field.
+    """
+    with _gemini_usage_lock:
+        return dict(_gemini_usage)
+
+def gemini_json(prompt: str, model: str = "gemini-2.5-flash", thinking: bool = True, stage: str = "other",
+                papers: int = 1, raise_errors: bool = False) -> dict | list:
+    """
+    One JSON-mode Gemini call; unparseable output gives {}. API/transport errors (quota, 429, network)
+    also give {} unless raise_errors=True, which lets the caller tell them apart from a bad answer.
+    """
     if not GEMINI_API_KEY:
         return {}
+    config = {"response_mime_type": "application/json"}
+    if not thinking:
+        config["thinking_config"] = {"thinking_budget": 0}
     try:
+        t0 = monotonic()
         resp = client.models.generate_content(
             model=model,
             contents=prompt,
-            config={"response_mime_type": "application/json"},
+            config=config,
         )
+        tokens = getattr(resp.usage_metadata, "total_token_count", None) or 0
+        est = estimate_tokens(prompt)
+        with _gemini_usage_lock:
+            _prompt_log.append({"t": datetime.now().isoformat(timespec="seconds"), "stage": stage, "model": model,
+                                "papers": papers, "est_tokens": est,
+                                "prompt_tokens": getattr(resp.usage_metadata, "prompt_token_count", None)})
+            _gemini_usage[f"{stage}.est_tokens"] += est
+            _gemini_usage[f"{stage}.calls"] += 1
+            _gemini_usage[f"{stage}.papers"] += papers
+            _gemini_usage[f"{stage}.tokens"] += tokens
+            _gemini_usage[f"{stage}.seconds"] += monotonic() - t0
         txt = resp.text or ""
         try:
             return json.loads(txt)
@@ -213,6 +452,8 @@ def gemini_json(prompt: str, model: str = "gemini-2.5-flash") -> dict | list:
             m = re.search(r"\{[\s\S]*\}|\[[\s\S]*\]", txt)
             return json.loads(m.group(0)) if m else {}
     except Exception:
+        if raise_errors:
+            raise
         return {}
 
 def gemini_boolean_query(user_query: str) -> dict:
@@ -233,7 +474,7 @@ Priority topics: {prefs.get('topics')}
 def gemini_extract_from_text(raw_text: str):
     """
     Extract refs from pasted text (e.g., Google Scholar page).
-    Returns list of {title, authors:[...], year, doi?}
+    Returns list of {title, authors:[...], year, doi?, arxiv?}
     """
     data = gemini_json(f"""
 You are an academic reference extractor.
@@ -242,6 +483,7 @@ From the text below, extract a list of references as JSON array. Each object mus
 - "authors" (list of names)
 - "year" (int if available else null)
 - "doi" (string DOI without https://doi.org/ if present else null)
+- "arxiv" (arXiv identifier like 2101.00001 if present else null)
 
 Text:
 {raw_text}
@@ -264,132 +506,465 @@ Return strictly a JSON array.
             if isinstance(doi, str):
                 m = DOI_RE.search(doi)
                 doi = m.group(0) if m else doi.strip()
-            out.append({"title": title, "authors": authors, "year": year, "doi": doi})
+            arxiv = it.get("arxiv")
+            m = re.search(r"\d{4}\.\d{4,5}", arxiv) if isinstance(arxiv, str) else None
+            arxiv = m.group(0) if m else None
+            out.append({"title": title, "authors": authors, "year": year, "doi": doi, "arxiv": arxiv})
     return out
 
-def gemini_annotate_paper(title, authors, snippet, pdf_text, url, user_query):
-    """
-    Return: abstract (10–15 sentences), tags [aRT..., aTa..., aTy..., aMe..., ai score-n], score3 (0..3)
-    """
-    prompt = f"""
-You are an academic assistant. Analyze this paper and return JSON with keys:
-- "abstract": a 10–15 sentence abstract (self-contained; no refs; no hallucinations)
+ANNOTATION_SPEC = """- "abstract": a 10–15 sentence abstract (self-contained; no refs; no hallucinations)
 - "tags": list of strings with REQUIRED prefixes:
   * aRT – research topic (1–2 concise tags)
   * aTa – very specific topical tags (3–6 concise tags)
   * aTy – paper type (e.g., review, experimental, meta-analysis)
-  * aMe – key method(s)
-  * Plus exactly one tag "ai score-N" where N is 0..3
-- "score3": integer 0..3 relevance to the query (0=marginal, 3=high)
+  * aMe – key method(s)"""
 
-Paper info:
-Title: {title}
-Authors: {authors}
-Context: {snippet}
-PDF: {pdf_text}
-URL: {url}
+def _paper_info(title, authors, snippet, pdf_text, url) -> str:
+    """Paper block of an annotation prompt: snippet + PDF text fitted to the token budget (prompt_budget)."""
+    context, pdf_part, est = prompt_budget.fit_paper_text(snippet, pdf_text)
+    with _gemini_usage_lock:
+        _gemini_usage["annotate.fitted"] += 1
+        for field, n in est.items():
+            _gemini_usage[f"annotate.field.{field}"] += n
+    return f"Title: {title}\nAuthors: {authors}\nContext: {context}\nPDF: {pdf_part}\nURL: {url}"
 
-User query: {user_query}
-Priority topics: {prefs.get('topics')}
-Priority authors: {prefs.get('authors')}
+def _triage_info(title, authors, snippet) -> str:
+    return f"Title: {title}\nAuthors: {(authors or '')[:300]}\nAbstract: {(snippet or '')[:1200]}"
 
-Output JSON only.
-"""
-    data = gemini_json(prompt)
-    abstract, tags, score3 = "", [], 0
+def _summary_info(title, abstract, tags) -> str:
+    return f"Title: {title}\nTags: {', '.join(tags or [])}\nSummary: {(abstract or '')[:1500]}"
+
+def _prefs_block(user_query) -> str:
+    return f"User query: {user_query}\nPriority topics: {prefs.get('topics')}\nPriority authors: {prefs.get('authors')}"
+
+def _paper_key(ident):
+    return cache_key("paper", ident, ANNOTATION_MODEL)
+
+def _triage_key(ident, user_query):
+    return cache_key("triage", ident, user_query, prefs.get("topics"), prefs.get("authors"), TRIAGE_MODEL)
+
+def _score_key(ident, user_query):
+    return cache_key("score", ident, user_query, prefs.get("topics"), prefs.get("authors"), SCORING_MODEL)
+
+def _annotation_of(data) -> tuple[str, list]:
+    abstract, tags = "", []
     if isinstance(data, dict):
         abstract = data.get("abstract", "") or ""
-        raw_tags = data.get("tags", []) or []
-        score3 = data.get("score3", 0) or 0
+        tags = [t for t in (data.get("tags", []) or [])
+                if isinstance(t, str) and not t.lower().startswith("ai score-")]
+    return abstract.strip(), tags
+
+def _score3_of(data) -> int:
+    score3 = 0
+    if isinstance(data, dict):
         try:
-            score3 = int(score3)
+            score3 = int(data.get("score3", 0) or 0)
         except Exception:
             score3 = 0
-        tags = [t for t in raw_tags if isinstance(t, str)]
+    return max(0, min(3, score3))
+
+def gemini_paper_annotation(title, authors, snippet, pdf_text, url, doi=None) -> tuple[str, list]:
+    """
+    Query-independent stage: abstract (10–15 sentences) + tags [aRT..., aTa..., aTy..., aMe...].
+    Computed once per paper and kept in the annotation cache.
+    """
+    ident = paper_identity(title, doi)
+    key = _paper_key(ident)
+    data = annotation_cache().get(key) if ident != "title:" else None  # untitled papers are never cached
+    if data is None:
+        data = gemini_json(f"""
+You are an academic assistant. Analyze this paper and return JSON with keys:
+{ANNOTATION_SPEC}
+
+Paper info:
+{_paper_info(title, authors, snippet, pdf_text, url)}
+
+Output JSON only.
+""", model=ANNOTATION_MODEL, stage="annotate", raise_errors=True)
+        if isinstance(data, dict) and data and ident != "title:":
+            annotation_cache().set(key, data, ttl=PAPER_ANNOTATION_TTL)
+    return _annotation_of(data)
+
+def _cached_score3(key: str, ident: str, prompt: str, model: str, stage: str) -> int:
+    """Thinking-free {"score3": N} call, cached under `key` (never for untitled papers); clamped to 0..3."""
+    data = annotation_cache().get(key) if ident != "title:" else None
+    if data is None:
+        data = gemini_json(prompt, model=model, thinking=False, stage=stage, raise_errors=True)
+        if isinstance(data, dict) and "score3" in data and ident != "title:":
+            annotation_cache().set(key, data)
+    return _score3_of(data)
+
+def gemini_triage_score(title, authors, snippet, user_query, doi=None) -> int:
+    """
+    Cascade tier 1: the cheap TRIAGE_MODEL rates title + source abstract only (no PDF) and returns just score3.
+    Cached by paper identity + query + priority topics/authors + model.
+    """
+    ident = paper_identity(title, doi)
+    return _cached_score3(_triage_key(ident, user_query), ident, f"""
+Rate relevance to the query. JSON only: {{"score3": N}}, N 0..3 (0=marginal, 3=high). Priority topics/authors raise it.
+{_prefs_block(user_query)}
+{_triage_info(title, authors, snippet)}
+""", TRIAGE_MODEL, "triage")
+
+def gemini_relevance_score(title, abstract, tags, user_query, doi=None) -> int:
+    """
+    Query-dependent stage: a small, thinking-free call that returns only score3 (0..3).
+    Cached by paper identity + query + priority topics/authors + model.
+    """
+    ident = paper_identity(title, doi)
+    return _cached_score3(_score_key(ident, user_query), ident, f"""
+Rate how relevant this paper is to the user query. Return JSON {{"score3": N}} with N an integer 0..3
+(0=marginal, 1=low, 2=moderate, 3=high). Priority topics/authors raise relevance.
+
+{_summary_info(title, abstract, tags)}
+
+{_prefs_block(user_query)}
+""", SCORING_MODEL, "score")
+
+def gemini_annotate_paper(title, authors, snippet, pdf_text, url, user_query, doi=None):
+    """
+    Return: abstract (10–15 sentences), tags [aRT..., aTa..., aTy..., aMe..., ai score-n], score3 (0..3)
+    Two stages: cached per-paper annotation, then a cheap per-query relevance score.
+    """
+    abstract, tags = gemini_paper_annotation(title, authors, snippet, pdf_text, url, doi=doi)
+    score3 = gemini_relevance_score(title, abstract or snippet, tags, user_query, doi=doi)
     # ensure ai score-n tag exists and matches score3
-    score_tag = f"ai score-{max(0, min(3, score3))}"
-    if score_tag not in tags:
-        tags.append(score_tag)
-    return abstract.strip(), tags, max(0, min(3, score3))
+    return abstract, tags + [f"ai score-{score3}"], score3
+
+# ---------- Batched variants: several papers per request, same caches as above ----------
+BATCH_SIZE = 20                 # papers handed to one batch worker (same query)
+BATCH_PROMPT_TOKENS = {"annotate": 24000, "triage": 12000, "score": 12000}  # input budget per request
+BATCH_MAX_ITEMS = {"annotate": 6, "triage": 25, "score": 25}               # bounds output length too
+BATCH_PARALLEL = 4              # packed requests of one batch sent at once
+
+def _pack(items: dict, budget: int, max_items: int):
+    """Split {id: body} into chunks of at most max_items whose bodies fit `budget` estimated tokens."""
+    chunk, used = {}, 0
+    for pid, body in items.items():
+        t = estimate_tokens(body)
+        if chunk and (used + t > budget or len(chunk) >= max_items):
+            yield chunk
+            chunk, used = {}, 0
+        chunk[pid], used = body, used + t
+    if chunk:
+        yield chunk
+
+def gemini_json_batch(instructions: str, items: dict, *, stage: str, model: str, thinking: bool = True,
+                      valid=lambda obj: True, slots: BoundedSemaphore | None = None) -> dict:
+    """
+    Ask about many papers at once: shared `instructions`, then every {id: body}; the model returns a JSON
+    array of objects carrying their "id". Requests are packed to BATCH_PROMPT_TOKENS / BATCH_MAX_ITEMS
+    and the packed requests go out concurrently, each holding one of `slots` (the run's worker limit) if given.
+    Ids missing from the answer (malformed or truncated output) are retried as a smaller batch;
+    a batch that yields nothing usable is split in half, down to single papers. A request that fails
+    outright (quota, 429, network) is not split: its ids map to the exception instead.
+    Returns {id: object | Exception}.
+    """
+    chunks = list(_pack(items, BATCH_PROMPT_TOKENS[stage], BATCH_MAX_ITEMS[stage]))
+    if len(chunks) <= 1:
+        return _json_batch_call(instructions, chunks[0], stage, model, thinking, valid, slots) if chunks else {}
+    out = {}
+    with ThreadPoolExecutor(max_workers=min(BATCH_PARALLEL, len(chunks)), thread_name_prefix="gemini-batch") as pool:
+        for got in pool.map(lambda c: _json_batch_call(instructions, c, stage, model, thinking, valid, slots), chunks):
+            out |= got
+    return out
+
+def _json_batch_call(instructions, items, stage, model, thinking, valid, slots=None) -> dict:
+    listing = "\n\n".join(f"### id: {pid}\n{body}" for pid, body in items.items())
+    try:
+        with slots or nullcontext():
+            data = gemini_json(f"""{instructions}
+
+Return a JSON array with exactly one object per paper below ({len(items)} papers). Each object has "id"
+(copied exactly) plus the keys above. Output JSON only.
+
+{listing}
+""", model=model, thinking=thinking, stage=stage, papers=len(items), raise_errors=True)
+    except Exception as e:
+        return {pid: e for pid in items}  # smaller requests would fail the same way
+    got = {}
+    for obj in data if isinstance(data, list) else []:
+        if isinstance(obj, dict) and str(obj.get("id")) in items and valid(obj):
+            got[str(obj["id"])] = obj
+    missing = {pid: body for pid, body in items.items() if pid not in got}
+    if not missing or len(items) == 1:
+        return got
+    if got:
+        return got | _json_batch_call(instructions, missing, stage, model, thinking, valid, slots)
+    ids = list(items)
+    half = len(ids) // 2
+    for part in (ids[:half], ids[half:]):
+        got |= _json_batch_call(instructions, {pid: items[pid] for pid in part}, stage, model, thinking, valid,
+                                slots)
+    return got
+
+def _batched_scores(papers: list[dict], keys: list[str], bodies: list[str], instructions: str,
+                    stage: str, model: str, slots: BoundedSemaphore | None = None) -> list[int | Exception]:
+    """
+    score3 per paper: cache hits first, one batched request for the rest (cached afterwards);
+    the exception instead for papers whose request failed.
+    """
+    cache = annotation_cache()
+    idents = [paper_identity(p.get("title"), p.get("doi")) for p in papers]
+    data = [cache.get(k) if ident != "title:" else None for k, ident in zip(keys, idents)]
+    todo = {f"p{i}": bodies[i] for i, d in enumerate(data) if d is None}
+    answers = gemini_json_batch(instructions, todo, stage=stage, model=model, thinking=False,
+                                valid=lambda o: "score3" in o, slots=slots)
+    for pid, obj in answers.items():
+        i = int(pid[1:])
+        if isinstance(obj, Exception):
+            data[i] = obj
+            continue
+        data[i] = {"score3": obj["score3"]}
+        if idents[i] != "title:":
+            cache.set(keys[i], data[i])
+    return [d if isinstance(d, Exception) else _score3_of(d) for d in data]
+
+def gemini_triage_batch(papers: list[dict], user_query: str,
+                        slots: BoundedSemaphore | None = None) -> list[int | Exception]:
+    """Batched gemini_triage_score for papers sharing one query."""
+    keys = [_triage_key(paper_identity(p.get("title"), p.get("doi")), user_query) for p in papers]
+    bodies = [_triage_info(p.get("title", ""), p.get("authors_info", ""), p.get("snippet", "")) for p in papers]
+    return _batched_scores(papers, keys, bodies, f"""
+Rate each paper's relevance to the query: "score3" integer 0..3 (0=marginal, 3=high). Priority topics/authors raise it.
+{_prefs_block(user_query)}""", "triage", TRIAGE_MODEL, slots)
+
+def gemini_relevance_batch(papers: list[dict], annotations: list[tuple[str, list]], user_query: str,
+                           slots: BoundedSemaphore | None = None) -> list[int | Exception]:
+    """Batched gemini_relevance_score; annotations are (abstract, tags) per paper."""
+    keys = [_score_key(paper_identity(p.get("title"), p.get("doi")), user_query) for p in papers]
+    bodies = [_summary_info(p.get("title", ""), abstract or p.get("snippet", ""), tags)
+              for p, (abstract, tags) in zip(papers, annotations)]
+    return _batched_scores(papers, keys, bodies, f"""
+Rate how relevant each paper is to the user query: "score3" integer 0..3
+(0=marginal, 1=low, 2=moderate, 3=high). Priority topics/authors raise relevance.
+
+{_prefs_block(user_query)}""", "score", SCORING_MODEL, slots)
+
+def gemini_paper_annotation_batch(papers: list[dict], pdf_texts: list[str],
+                                  slots: BoundedSemaphore | None = None) -> list[tuple[str, list] | Exception]:
+    """Batched gemini_paper_annotation: (abstract, tags) per paper, or the exception if its request failed."""
+    cache = annotation_cache()
+    idents = [paper_identity(p.get("title"), p.get("doi")) for p in papers]
+    data = [cache.get(_paper_key(ident)) if ident != "title:" else None for ident in idents]
+    todo = {f"p{i}": _paper_info(p.get("title", ""), p.get("authors_info", ""), p.get("snippet", ""),
+                                 pdf_texts[i], p.get("url", ""))
+            for i, (p, d) in enumerate(zip(papers, data)) if d is None}
+    answers = gemini_json_batch(f"""
+You are an academic assistant. Analyze each paper below and give these keys:
+{ANNOTATION_SPEC}""", todo, stage="annotate", model=ANNOTATION_MODEL,
+                                valid=lambda o: isinstance(o.get("abstract"), str) and isinstance(o.get("tags"), list),
+                                slots=slots)
+    for pid, obj in answers.items():
+        i = int(pid[1:])
+        if isinstance(obj, Exception):
+            data[i] = obj
+            continue
+        data[i] = {"abstract": obj["abstract"], "tags": obj["tags"]}
+        if idents[i] != "title:":
+            cache.set(_paper_key(idents[i]), data[i], ttl=PAPER_ANNOTATION_TTL)
+    return [d if isinstance(d, Exception) else _annotation_of(d) for d in data]
 
 # ============================
 # SEARCH PROVIDERS (S2 + PubMed) + Crossref + Google fallback
 # ============================
-def search_semantic_scholar(query, limit=10):
-    """Stable Semantic Scholar search."""
+S2_FIELDS = "title,authors,url,abstract,openAccessPdf,externalIds,venue,year,citationCount,publicationDate,publicationTypes"
+S2_BATCH_MAX = 500  # ids per /paper/batch request
+
+def _s2_result(paper: dict, doi: str | None = None) -> dict:
+    """Semantic Scholar paper JSON → our unified result dict."""
+    if isinstance(paper.get("externalIds"), dict):
+        doi = paper["externalIds"].get("DOI") or doi
+    return {
+        "title": paper.get("title", ""),
+        "url": paper.get("url", "") or (f"https://doi.org/{doi}" if doi else ""),
+        "authors_info": ", ".join([a.get("name", "") for a in paper.get("authors", []) or []]),
+        "snippet": clean_snippet(paper.get("abstract", "") or ""),
+        "pdf_url": (paper.get("openAccessPdf") or {}).get("url", ""),
+        "doi": doi,
+        "venue": paper.get("venue"),
+        "year": paper.get("year"),
+        "citationCount": paper.get("citationCount"),
+        "publicationDate": paper.get("publicationDate"),
+        "publicationTypes": paper.get("publicationTypes"),
+        "pmid": (paper.get("externalIds") or {}).get("PubMed"),
+        "source": "s2",
+        "s2_id": paper.get("paperId"),
+    }
+
+def search_semantic_scholar(query, limit=10, raise_errors=False):
+    """Stable Semantic Scholar search. With raise_errors=True failures propagate instead of st.error (worker threads)."""
     url = "https://api.semanticscholar.org/graph/v1/paper/search"
     headers = {"x-api-key": SEMANTIC_SCHOLAR_API_KEY} if SEMANTIC_SCHOLAR_API_KEY else {}
-    params = {
-        "query": query,
-        "limit": limit,
-        "fields": "title,authors,url,abstract,openAccessPdf,externalIds,venue,year,citationCount,publicationDate,publicationTypes"
-    }
+    params = {"query": query, "limit": limit, "fields": S2_FIELDS}
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+        response = http_client.get(url, headers=headers, params=params, timeout=30)
         response.raise_for_status()
         data = response.json()
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"Semantic Scholar error: {e}")
         return []
 
-    results = []
-    for paper in (data or {}).get("data", []) or []:
-        doi = None
-        if isinstance(paper.get("externalIds"), dict):
-            doi = paper["externalIds"].get("DOI")
-        results.append({
-            "title": paper.get("title", ""),
-            "url": paper.get("url", "") or (f"https://doi.org/{doi}" if doi else ""),
-            "authors_info": ", ".join([a.get("name", "") for a in paper.get("authors", [])]),
-            "snippet": clean_snippet(paper.get("abstract", "") or ""),
-            "pdf_url": (paper.get("openAccessPdf") or {}).get("url", ""),
-            "doi": doi,
-            "venue": paper.get("venue"),
-            "year": paper.get("year"),
-            "citationCount": paper.get("citationCount"),
-            "publicationDate": paper.get("publicationDate"),
-            "publicationTypes": paper.get("publicationTypes"),
-        })
-    return results
-
-def semantic_scholar_by_doi(doi: str):
-    if not doi:
-        return None
-    url = f"https://api.semanticscholar.org/graph/v1/paper/DOI:{doi}"
+    return [_s2_result(paper) for paper in (data or {}).get("data", []) or []]
+
+def _s2_bulk_query(query: str) -> str:
+    """Our AND/OR/NOT Boolean syntax → bulk search syntax (+ and, | or, -term negation; quotes/parens kept)."""
+    q = re.sub(r"\bNOT\s+", "-", query or "")
+    q = re.sub(r"\s+AND\s+", " + ", q)
+    return re.sub(r"\s+OR\s+", " | ", q).strip()
+
+def iter_semantic_scholar_bulk(query: str, max_total: int = 1000):
+    """
+    Deep Semantic Scholar retrieval via /paper/search/bulk: yields one page (≤1000 results) at a time,
+    following the continuation token until `max_total` results or the end. Errors propagate.
+    """
+    url = "https://api.semanticscholar.org/graph/v1/paper/search/bulk"
     headers = {"x-api-key": SEMANTIC_SCHOLAR_API_KEY} if SEMANTIC_SCHOLAR_API_KEY else {}
-    params = {"fields": "title,authors,url,abstract,openAccessPdf,externalIds,venue,year,citationCount,publicationDate,publicationTypes"}
-    try:
-        r = requests.get(url, headers=headers, params=params, timeout=20)
+    params = {"query": _s2_bulk_query(query), "fields": S2_FIELDS}
+    sent = 0
+    while sent < max_total:
+        r = http_client.get(url, headers=headers, params=params, timeout=60)
         r.raise_for_status()
-        p = r.json()
-        return {
-            "title": p.get("title", ""),
-            "url": p.get("url", "") or (f"https://doi.org/{doi}"),
-            "authors_info": ", ".join([a.get("name", "") for a in p.get("authors", [])]),
-            "snippet": clean_snippet(p.get("abstract", "") or ""),
-            "pdf_url": (p.get("openAccessPdf") or {}).get("url", ""),
-            "doi": (p.get("externalIds") or {}).get("DOI") or doi,
-            "venue": p.get("venue"),
-            "year": p.get("year"),
-            "citationCount": p.get("citationCount"),
-            "publicationDate": p.get("publicationDate"),
-            "publicationTypes": p.get("publicationTypes"),
-        }
-    except Exception:
-        return None
+        data = r.json() or {}
+        page = [_s2_result(p) for p in (data.get("data") or [])[:max_total - sent]]
+        if page:
+            sent += len(page)
+            yield page
+        if not data.get("token") or not page:
+            return
+        params["token"] = data["token"]
+
+def semantic_scholar_batch(ids: list[str]) -> list[dict | None]:
+    """
+    Resolve S2 ids ("DOI:10.x/…", "ARXIV:2101.00001", …) with POST /paper/batch, up to 500 per request.
+    Returns one result (or None if unknown / failed) per input id, in input order.
+    """
+    url = "https://api.semanticscholar.org/graph/v1/paper/batch"
+    headers = {"x-api-key": SEMANTIC_SCHOLAR_API_KEY} if SEMANTIC_SCHOLAR_API_KEY else {}
+    out = []
+    for chunk in _chunks(list(ids), S2_BATCH_MAX):
+        try:
+            r = http_client.post(url, headers=headers, params={"fields": S2_FIELDS}, json={"ids": chunk}, timeout=60)
+            r.raise_for_status()
+            papers = r.json() or []
+        except Exception:
+            papers = []
+        for i, sid in enumerate(chunk):
+            p = papers[i] if i < len(papers) else None
+            doi = sid[4:] if sid.upper().startswith("DOI:") else None
+            out.append(_s2_result(p, doi) if isinstance(p, dict) else None)
+    return out
+
+PUBMED_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+PUBMED_TITLE_BATCH = 20  # titles OR-joined into one ESearch
+PUBMED_PAGE_SIZE = 200     # EFetch records per page in deep retrieval
+PUBMED_MAX_RECORDS = 10000  # PubMed will not page a search past this
+TITLE_STOPWORDS = {"and", "or", "not", "the", "for", "with", "from", "into", "via", "its", "are", "was", "were"}
 
-def search_pubmed(query, limit=10):
+def _ncbi_params(**params) -> dict:
+    params = {"db": "pubmed", "email": NCBI_EMAIL, **params}
+    if NCBI_API_KEY:
+        params["api_key"] = NCBI_API_KEY
+    return params
+
+def _text(el) -> str:
+    return re.sub(r"\s+", " ", "".join(el.itertext())).strip() if el is not None else ""
+
+def _pubmed_article(art) -> dict:
+    """<PubmedArticle> element → our unified result dict (everything ESummary used to provide, plus DOI)."""
+    pmid = art.findtext("MedlineCitation/PMID") or ""
+    article = art.find("MedlineCitation/Article")
+    article = article if article is not None else ET.Element("Article")
+    journal = article.find("Journal")
+    journal = journal if journal is not None else ET.Element("Journal")
+
+    authors = []
+    for a in article.findall("AuthorList/Author"):
+        nm = a.findtext("CollectiveName") or " ".join(filter(None, [a.findtext("LastName"), a.findtext("Initials")]))
+        if nm:
+            authors.append(nm)
+
+    # "2021 Mar 4" like ESummary's pubdate; MedlineDate covers ranges such as "2019 Nov-Dec"
+    pd = journal.find("JournalIssue/PubDate")
+    pubdate = ""
+    if pd is not None:
+        pubdate = pd.findtext("MedlineDate") or " ".join(filter(None, [pd.findtext("Year"), pd.findtext("Month"), pd.findtext("Day")]))
+    m = re.search(r"\b(19|20)\d{2}\b", pubdate)
+    year = int(m.group(0)) if m else None
+
+    doi = None
+    for aid in art.findall("PubmedData/ArticleIdList/ArticleId"):
+        if aid.get("IdType") == "doi" and aid.text:
+            doi = aid.text.strip()
+            break
+    if not doi:
+        for eid in article.findall("ELocationID"):
+            if eid.get("EIdType") == "doi" and eid.text:
+                doi = eid.text.strip()
+                break
+
+    abstract = " ".join(_text(n) for n in article.findall("Abstract/AbstractText")).strip()
+    return {
+        "title": _text(article.find("ArticleTitle")),
+        "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
+        "authors_info": ", ".join(authors),
+        "snippet": clean_snippet(abstract) or clean_snippet(journal.findtext("ISOAbbreviation") or ""),
+        "pdf_url": "",
+        "doi": doi,
+        "pmid": pmid,
+        "venue": journal.findtext("Title") or journal.findtext("ISOAbbreviation"),
+        "year": year,
+        "citationCount": None,
+        "publicationDate": pubdate or None,
+        "publicationTypes": [_text(t) for t in article.findall("PublicationTypeList/PublicationType")] or None,
+        "source": "pubmed",
+    }
+
+def iter_pubmed_efetch(source: dict):
     """
-    Simple, robust PubMed: GET ESearch + ESummary + (best-effort) EFetch abstracts; term capped to 300 chars.
+    EFetch XML for {"id": …} or a WebEnv/query_key, yielding one result per article.
+    Parsed incrementally with iterparse; finished articles are cleared, so memory stays flat for large retmax.
+    History pages are streamed; a bounded id list is read whole so the response cache can keep it.
+    """
+    stream = "WebEnv" in source
+    resp = http_client.post(f"{PUBMED_BASE}/efetch.fcgi", params=_ncbi_params(retmode="xml"), data=source,
+                            timeout=60, stream=stream)
+    try:
+        resp.raise_for_status()
+        if stream:
+            resp.raw.decode_content = True
+        root = None
+        for event, elem in ET.iterparse(resp.raw if stream else io.BytesIO(resp.content), events=("start", "end")):
+            if root is None:
+                root = elem
+            elif event == "end" and elem.tag == "PubmedArticle":
+                yield _pubmed_article(elem)
+                root.clear()
+    finally:
+        resp.close()
+
+def _pubmed_fetch(source: dict, order: list[str] | None = None) -> list[dict]:
+    """All EFetch results for `source`; reordered to `order` (PMIDs) when given."""
+    records = list(iter_pubmed_efetch(source))
+    if order is None:
+        return records
+    by_pmid = {r["pmid"]: r for r in records}
+    return [by_pmid[pmid] for pmid in order if pmid in by_pmid]
+
+def search_pubmed(query, limit=10, raise_errors=False):
+    """
+    Simple, robust PubMed: GET ESearch, then one (cached) EFetch that carries metadata, abstract and DOI;
+    term capped to 300 chars. With raise_errors=True failures propagate instead of st.error.
     """
-    base = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
     term = (query or "")[:300]  # PubMed truncation
-    es_params = {"db": "pubmed", "term": term, "retmode": "json", "retmax": limit, "email": NCBI_EMAIL}
-    if NCBI_API_KEY:
-        es_params["api_key"] = NCBI_API_KEY
     try:
-        es = requests.get(f"{base}/esearch.fcgi", params=es_params, timeout=30).json()
+        es = http_client.get(f"{PUBMED_BASE}/esearch.fcgi", params=_ncbi_params(term=term, retmode="json", retmax=limit),
+                             timeout=30).json()
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"PubMed ESearch error: {e}")
         return []
 
@@ -397,60 +972,80 @@ def search_pubmed(query, limit=10):
     if not ids:
         return []
 
-    # ESummary (basic metadata)
-    sum_params = {"db": "pubmed", "id": ",".join(ids), "retmode": "json", "email": NCBI_EMAIL}
-    if NCBI_API_KEY:
-        sum_params["api_key"] = NCBI_API_KEY
     try:
-        sm = requests.get(f"{base}/esummary.fcgi", params=sum_params, timeout=30).json()
+        return _pubmed_fetch({"id": ",".join(ids[:limit])}, order=ids[:limit])
     except Exception as e:
-        st.error(f"PubMed ESummary error: {e}")
+        if raise_errors:
+            raise
+        st.error(f"PubMed EFetch error: {e}")
         return []
 
-    # EFetch to get abstracts (XML) — best effort
-    abstracts = {}
-    try:
-        ef_params = {"db": "pubmed", "retmode": "xml", "email": NCBI_EMAIL}
-        if NCBI_API_KEY:
-            ef_params["api_key"] = NCBI_API_KEY
-        ef = requests.post(f"{base}/efetch.fcgi", params=ef_params, data={"id": ",".join(ids)}, timeout=40)
-        ef.raise_for_status()
-        root = ET.fromstring(ef.text)
-        for art in root.findall(".//PubmedArticle"):
-            pmid = art.findtext(".//PMID")
-            abst_nodes = art.findall(".//Abstract/AbstractText")
-            abs_text = " ".join((n.text or "") for n in abst_nodes).strip()
-            abstracts[pmid] = clean_snippet(abs_text)
-    except Exception:
-        pass
-
-    out, block = [], sm.get("result", {}) or {}
-    for pmid in ids[:limit]:
-        r = block.get(pmid, {}) or {}
-        jrnl = r.get("fulljournalname") or r.get("source")
-        # year parsing
-        year = None
+def iter_pubmed_pages(query: str, max_total: int = 1000, page_size: int = PUBMED_PAGE_SIZE):
+    """
+    Deep PubMed retrieval: one ESearch with usehistory=y, then EFetch pages off the WebEnv with retstart.
+    Yields one page of results at a time (each parsed incrementally); capped at PUBMED_MAX_RECORDS,
+    the most PubMed lets a search page through. Errors propagate.
+    """
+    es = http_client.get(f"{PUBMED_BASE}/esearch.fcgi", timeout=30, params=_ncbi_params(
+        term=(query or "")[:300], retmode="json", retmax=0, usehistory="y"))
+    es.raise_for_status()
+    res = es.json().get("esearchresult", {}) or {}
+    total = min(int(res.get("count") or 0), max_total, PUBMED_MAX_RECORDS)
+    history = {"WebEnv": res.get("webenv"), "query_key": res.get("querykey")}
+    if not total or not history["WebEnv"]:
+        return
+    for start in range(0, total, page_size):
+        page = list(iter_pubmed_efetch(history | {"retstart": start, "retmax": min(page_size, total - start)}))
+        if not page:
+            return
+        yield page
+
+def _pubmed_title_term(title: str) -> str:
+    """ESearch clause for one title: up to 8 significant words, each fielded [ti], AND-joined."""
+    words = [w for w in normalize_title(title).split() if len(w) > 2 and w not in TITLE_STOPWORDS][:8]
+    return "(" + " AND ".join(f"{w}[ti]" for w in words) + ")" if words else ""
+
+def pubmed_resolve_titles(titles: list[str], min_ratio: float = 0.9) -> list[dict | None]:
+    """
+    Resolve many reference titles against PubMed in a handful of requests:
+    one OR-joined [ti] ESearch per PUBMED_TITLE_BATCH titles, one EPost of every hit, one EFetch
+    off that WebEnv, then local fuzzy matching of returned titles back to the inputs.
+    Returns one result (or None) per input title, in input order.
+    """
+    pmids = []
+    for chunk in _chunks(list(titles), PUBMED_TITLE_BATCH):
+        terms = [t for t in map(_pubmed_title_term, chunk) if t]
+        if not terms:
+            continue
         try:
-            dp = r.get("pubdate") or ""
-            m = re.search(r"\b(19|20)\d{2}\b", dp)
-            if m:
-                year = int(m.group(0))
+            es = http_client.post(f"{PUBMED_BASE}/esearch.fcgi", timeout=30, data=_ncbi_params(
+                term=" OR ".join(terms), retmode="json", retmax=10 * len(terms)))
+            es.raise_for_status()
+            pmids += (es.json().get("esearchresult", {}) or {}).get("idlist", []) or []
         except Exception:
-            pass
-
-        out.append({
-            "title": r.get("title", ""),
-            "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
-            "authors_info": ", ".join([a.get("name","") for a in (r.get("authors") or [])]) if isinstance(r.get("authors", []), list) else "",
-            "snippet": abstracts.get(pmid) or clean_snippet(r.get("source", "") or ""),
-            "pdf_url": "",
-            "doi": None,
-            "venue": jrnl,
-            "year": year,
-            "citationCount": None,
-            "publicationDate": r.get("pubdate"),
-            "publicationTypes": r.get("pubtype"),
-        })
+            continue
+    pmids = list(dict.fromkeys(pmids))
+    if not pmids:
+        return [None] * len(titles)
+
+    try:
+        ep = http_client.post(f"{PUBMED_BASE}/epost.fcgi", data=_ncbi_params(id=",".join(pmids)), timeout=30)
+        ep.raise_for_status()
+        root = ET.fromstring(ep.text)
+        candidates = _pubmed_fetch({"WebEnv": root.findtext("WebEnv"), "query_key": root.findtext("QueryKey"),
+                                    "retmax": len(pmids)})
+    except Exception:
+        return [None] * len(titles)
+
+    indexed = [(normalize_title(c.get("title")), c) for c in candidates]
+    out = []
+    for title in titles:
+        t, best, best_ratio = normalize_title(title), None, min_ratio
+        for ct, cand in indexed if t else []:
+            sm = SequenceMatcher(None, t, ct)
+            if sm.quick_ratio() >= best_ratio and sm.ratio() >= best_ratio:
+                best, best_ratio = cand, sm.ratio()
+        out.append(best)
     return out
 
 # ---------- Crossref enrichment (if DOI is known) ----------
@@ -459,7 +1054,9 @@ def crossref_enrich(doi: str) -> dict:
         return {}
     url = f"https://api.crossref.org/works/{doi}"
     try:
-        data = _request_json_with_retries(url, timeout=30)
+        r = http_client.get(url, timeout=30)  # retries/backoff handled by http_client
+        r.raise_for_status()
+        data = r.json()
         msg = (data or {}).get("message", {})
         if not msg:
             return {}
@@ -489,32 +1086,15 @@ def crossref_enrich(doi: str) -> dict:
         return {}
 
 # ---------- URL / PDF handling ----------
-def fetch_url_and_guess_pdf(url: str) -> tuple[bool, str]:
-    """Return (is_pdf, text). Detect PDF by header, extension, or magic bytes.
-       If PDF, extract up to 8000 chars; else return (False, "")."""
+def fetch_url_and_guess_pdf(url: str) -> tuple[str | None, str]:
+    """Return (sha, text). Detect PDF by magic bytes.
+       If PDF, its content hash and up to 8000 chars of text; else return (None, "").
+       The paper keeps the hash (pdf_sha), so the main loop reuses this download for its section parse."""
     try:
-        r = requests.get(url, timeout=45, allow_redirects=True)
-        r.raise_for_status()
-        ctype = r.headers.get("content-type", "").lower()
-        content = r.content
-
-        # PDF detection: by header, extension, or magic number
-        is_pdf = (
-            "pdf" in ctype
-            or url.lower().endswith(".pdf")
-            or content.startswith(b"%PDF")
-        )
-
-        if is_pdf:
-            with fitz.open(stream=io.BytesIO(content), filetype="pdf") as doc:
-                text = []
-                for page in doc:
-                    text.append(page.get_text())
-                return True, ("\n".join(text))[:8000]
-
-        return False, ""
+        sha = pdf_tools.download_pdf(url)
+        return (sha, pdf_tools.pdf_text_for(sha, 8000)) if sha else (None, "")
     except Exception:
-        return False, ""
+        return None, ""
 
 def extract_metadata_from_pdf_text(pdf_text: str) -> dict:
     """Find DOI, a plausible title, author line."""
@@ -547,7 +1127,7 @@ def extract_metadata_from_pdf_text(pdf_text: str) -> dict:
 def google_search_fallback(query: str):
     """Very light fallback via Google Custom Search (requires valid key & cx)."""
     try:
-        r = requests.get(
+        r = http_client.get(
             "https://www.googleapis.com/customsearch/v1",
             params={
                 "q": query,
@@ -576,56 +1156,576 @@ def google_search_fallback(query: str):
     except Exception:
         return []
 
+# ---------- Concurrent fan-out over providers ----------
+def fan_out_search(providers: dict, query: str, limit: int, *, on_done=None, deadline: float | None = None):
+    """
+    Query {name: search_fn} concurrently. Each provider is abandoned after its PROVIDER_TIMEOUTS budget;
+    if `deadline` (s) is set, everything still running then is abandoned too.
+    on_done(name, results, error) is called on this thread as each provider finishes.
+    Returns ({name: results}, [abandoned names]).
+    """
+    start = monotonic()
+    pool = ThreadPoolExecutor(max_workers=max(1, len(providers)), thread_name_prefix="search")
+    futs = {pool.submit(fn, query, limit=limit, raise_errors=True): name for name, fn in providers.items()}
+    ends = {}
+    for fut, name in futs.items():
+        ends[fut] = start + PROVIDER_TIMEOUTS.get(name, 30)
+        if deadline:
+            ends[fut] = min(ends[fut], start + deadline)
+
+    results, abandoned, pending = {}, [], set(futs)
+    try:
+        while pending:
+            timeout = max(0.0, min(ends[f] for f in pending) - monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, err = futs[fut], None
+                try:
+                    results[name] = fut.result() or []
+                except Exception as e:
+                    results[name], err = [], e
+                if on_done:
+                    on_done(name, results[name], err)
+            now = monotonic()
+            expired = {f for f in pending if ends[f] <= now}
+            abandoned.extend(futs[f] for f in expired)
+            pending -= expired
+    finally:
+        # a slow provider keeps its thread until its own request timeout; we just stop waiting for it
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results, abandoned
+
+_PAGES_DONE = object()
+
+def iter_deep_pages(providers: dict, query: str, max_total: int, *, on_error=None, queue_pages: int = 4):
+    """
+    Page through {name: page_generator_fn} concurrently and yield (name, page) as pages arrive.
+    Producers run ahead by at most `queue_pages` pages, so memory stays flat however deep the search goes;
+    closing this generator stops them. on_error(name, error) is called on this thread.
+    """
+    q, stop = Queue(maxsize=max(1, queue_pages)), Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce(name, fn):
+        try:
+            for page in fn(query, max_total):
+                if not _put((name, page, None)):
+                    return
+        except Exception as e:
+            _put((name, None, e))
+        finally:
+            _put((name, _PAGES_DONE, None))
+
+    for name, fn in providers.items():
+        Thread(target=_produce, args=(name, fn), name=f"pages-{name}", daemon=True).start()
+
+    running = len(providers)
+    try:
+        while running:
+            try:
+                name, page, err = q.get(timeout=0.5)
+            except Empty:
+                continue
+            if page is _PAGES_DONE:
+                running -= 1
+            elif err is not None:
+                if on_error:
+                    on_error(name, err)
+            else:
+                yield name, page
+    finally:
+        stop.set()
+
+# ============================
+# PIPELINE (concurrent PDF + annotation)
+# ============================
+def prerank_papers(papers: list[dict], ranker: prerank.Preranker, top_k: int, cutoff: float):
+    """Score papers locally (sets paper["local_score"]); returns (selected best-first, skipped)."""
+    scores = ranker.score(papers)
+    for p, sc in zip(papers, scores):
+        p["local_score"] = round(float(sc), 3)
+    keep = prerank.select(scores, top_k, cutoff).tolist()
+    kept = set(keep)
+    return [papers[i] for i in keep], [p for i, p in enumerate(papers) if i not in kept]
+
+SKIPPED_SHOWN = 50  # pre-ranked-out papers kept for the "Not sent to Gemini" table
+
+def new_skipped() -> dict:
+    """Papers pre-ranked out of a run: their count, plus the best SKIPPED_SHOWN as a min-heap."""
+    return {"n": 0, "near": []}
+
+def add_skipped(skipped: dict, paper: dict):
+    """Count a pre-ranked-out paper; only the SKIPPED_SHOWN best by local score are kept."""
+    skipped["n"] += 1
+    item = (paper["local_score"], -skipped["n"], paper)
+    if len(skipped["near"]) < SKIPPED_SHOWN:
+        heappush(skipped["near"], item)
+    else:
+        heappushpop(skipped["near"], item)
+
+def iter_prerank(pages, ranker: prerank.Preranker, top_k: int, cutoff: float, skipped: dict):
+    """
+    Pre-ranking over the whole deep candidate set: each page is scored on arrival (corpus statistics
+    accumulate) into a bounded top-K heap, so memory stays at `top_k` papers however many pages come in.
+    Only after the last page are the best `top_k` at or above `cutoff` yielded, best-first; ties keep
+    the provider's order. Everything else is counted in `skipped` (see add_skipped).
+    """
+    best = []  # min-heap of (local score, -arrival, paper)
+    n = 0
+    for page in pages:
+        for p, sc in zip(page, ranker.score(page)):
+            p["local_score"] = round(float(sc), 3)
+            item = (p["local_score"], -n, p)
+            n += 1
+            if p["local_score"] < cutoff:
+                add_skipped(skipped, p)
+            elif len(best) < top_k:
+                heappush(best, item)
+            else:
+                add_skipped(skipped, heappushpop(best, item)[2])
+    for _, _, p in sorted(best, key=lambda it: it[:2], reverse=True):
+        yield p
+
+def process_paper(paper: dict, user_query: str, full_from: int | None = None) -> dict:
+    """
+    Download/parse the PDF and annotate one paper. Runs in worker threads, so no st.* calls here.
+    With `full_from` set (cascade), a cheap triage score comes first and only papers scoring at least
+    `full_from` get the PDF download, full annotation and SCORING_MODEL score; the triage score is the
+    score3 of the rest. A failed Gemini call is the paper's error, never a low score.
+    """
+    out = {"pdf_text": "", "abstract_ai": "", "tags": [], "score3": 0, "error": None, "triaged": False}
+    try:
+        if GEMINI_API_KEY and full_from is not None:
+            out["score3"] = gemini_triage_score(paper.get("title", ""), paper.get("authors_info", ""),
+                                                paper.get("snippet", ""), user_query, doi=paper.get("doi"))
+            if out["score3"] < full_from:
+                out.update(tags=[f"ai score-{out['score3']}"], triaged=True)
+                return out
+        out["pdf_text"] = paper_pdf_text(paper)
+        if GEMINI_API_KEY:
+            out["abstract_ai"], out["tags"], out["score3"] = gemini_annotate_paper(
+                paper.get("title", ""), paper.get("authors_info", ""), paper.get("snippet", ""),
+                out["pdf_text"], paper.get("url", ""), user_query, doi=paper.get("doi"),
+            )
+    except Exception as e:
+        out["error"] = str(e)
+    return out
+
+def _batch_or_each(outs: list[dict], todo: list[int], batch, one) -> dict:
+    """
+    {index: answer} for the papers at `todo`: batch() answers all of them in order, an exception in place of
+    an answer marking that paper's request as failed. If batch() itself raises, one(i) runs per paper instead.
+    A paper whose request failed gets the error in outs[i] and no answer.
+    """
+    got = {}
+    try:
+        answers = batch()
+    except Exception:
+        answers = None
+    if answers is not None:
+        for i, answer in zip(todo, answers):
+            if isinstance(answer, Exception):
+                outs[i]["error"] = str(answer)
+            else:
+                got[i] = answer
+        return got
+    for i in todo:
+        try:
+            got[i] = one(i)
+        except Exception as e:
+            outs[i]["error"] = str(e)
+    return got
+
+def _held(slots: BoundedSemaphore | None, fn, *args):
+    with slots or nullcontext():
+        return fn(*args)
+
+def process_batch(papers: list[dict], user_query: str, full_from: int | None = None,
+                  slots: BoundedSemaphore | None = None) -> list[dict]:
+    """
+    process_paper for several papers sharing one query: triage, annotation and scoring each go out as
+    a few multi-paper Gemini requests (gemini_*_batch) and PDFs are fetched concurrently. No st.* calls.
+    Every PDF download and Gemini request holds one of `slots`, the limit shared by all batches of a run.
+    A failing batched request falls back to per-paper calls, so an error stays with the paper that caused it.
+    """
+    outs = [{"pdf_text": "", "abstract_ai": "", "tags": [], "score3": 0, "error": None, "triaged": False}
+            for _ in papers]
+    todo = list(range(len(papers)))
+    if GEMINI_API_KEY and full_from is not None:
+        triage = _batch_or_each(
+            outs, todo, lambda: gemini_triage_batch(papers, user_query, slots),
+            lambda i: gemini_triage_score(papers[i].get("title", ""), papers[i].get("authors_info", ""),
+                                          papers[i].get("snippet", ""), user_query, doi=papers[i].get("doi")))
+        for i, score3 in triage.items():
+            outs[i].update(score3=score3, tags=[f"ai score-{score3}"], triaged=score3 < full_from)
+        todo = [i for i in todo if i in triage and not outs[i]["triaged"]]
+    if not todo:
+        return outs
+    with ThreadPoolExecutor(max_workers=min(8, len(todo)), thread_name_prefix="pdf") as pdfs:
+        texts = pdfs.map(lambda i: _held(slots, paper_pdf_text, papers[i]), todo)
+        for i, text in zip(todo, texts):
+            outs[i]["pdf_text"] = text
+    if not GEMINI_API_KEY:
+        return outs
+    subset = [papers[i] for i in todo]
+    annotations = _batch_or_each(
+        outs, todo, lambda: gemini_paper_annotation_batch(subset, [outs[i]["pdf_text"] for i in todo], slots),
+        lambda i: gemini_paper_annotation(papers[i].get("title", ""), papers[i].get("authors_info", ""),
+                                          papers[i].get("snippet", ""), outs[i]["pdf_text"], papers[i].get("url", ""),
+                                          doi=papers[i].get("doi")))
+    todo = [i for i in todo if i in annotations]
+    # papers that passed triage are scored again on their full annotation
+    scores = _batch_or_each(
+        outs, todo, lambda: gemini_relevance_batch([papers[i] for i in todo], [annotations[i] for i in todo],
+                                                   user_query, slots),
+        lambda i: gemini_relevance_score(papers[i].get("title", ""), annotations[i][0] or papers[i].get("snippet", ""),
+                                         annotations[i][1], user_query, doi=papers[i].get("doi")))
+    for i, score3 in scores.items():
+        abstract, tags = annotations[i]
+        outs[i].update(abstract_ai=abstract, tags=tags + [f"ai score-{score3}"], score3=score3)
+    return outs
+
+def _single(papers, user_query, **kwargs):
+    return [process_paper(papers[0], user_query, **kwargs)]
+
+def _groups(jobs, size: int):
+    """Consecutive (paper, user_query) jobs → (papers, user_query) groups of up to `size` sharing the query."""
+    batch, query = [], None
+    for paper, user_query in jobs:
+        if batch and (user_query != query or len(batch) >= size):
+            yield batch, query
+            batch = []
+        batch.append(paper)
+        query = user_query
+    if batch:
+        yield batch, query
+
+def iter_annotated(jobs, workers: int = 4, batch_size: int = 1, **kwargs):
+    """
+    Run process_paper over (paper, user_query) jobs with a bounded pool (kwargs are passed through);
+    with batch_size > 1, consecutive jobs sharing a query go to process_batch together, and `workers` also caps
+    the PDF downloads and Gemini requests of all batches combined.
+    Yields (paper, result) in input order; at most 2*workers jobs (or batches) are in flight ahead of the consumer.
+    """
+    workers = max(1, int(workers))
+    fn = process_batch if batch_size > 1 else _single
+    if batch_size > 1:
+        kwargs["slots"] = BoundedSemaphore(workers)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="annotate")
+    window = deque()
+    try:
+        for papers, user_query in _groups(jobs, max(1, batch_size)):
+            if len(window) >= 2 * workers:
+                ps, fut = window.popleft()
+                yield from zip(ps, fut.result())
+            window.append((papers, pool.submit(fn, papers, user_query, **kwargs)))
+        while window:
+            ps, fut = window.popleft()
+            yield from zip(ps, fut.result())
+    finally:
+        # st.stop() or an error mid-render must not leave queued downloads running
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# ============================
+# RESULTS (rendered live during a run and again on every rerun from session state)
+# ============================
+QUERY_LABEL = "✏️ Editable search query (edit, then re-search):"
+
+def zotero_threshold() -> int:
+    """Zotero threshold on score3 (0..3)."""
+    return min(3, max(0, int(min_score3)))
+
+def cascade_full_from() -> int | None:
+    """Cascade: full annotation for anything that may be displayed in full or saved to Zotero (None = no cascade)."""
+    if not use_cascade:
+        return None
+    return min(full_annotation_from, zotero_threshold()) if add_to_zotero else full_annotation_from
+
+def render_paper(paper: dict, res: dict, full_from: int | None, *, expanded: bool = True,
+                 select_default: bool | None = None, select_key: str = ""):
+    """
+    One result expander. Returns (placeholder for the Zotero outcome, whether the paper is ticked for Zotero);
+    the "Select for Zotero" box is only shown when `select_default` is given.
+    """
+    title = paper.get("title", "")
+    url = paper.get("url", "")
+    authors_info = paper.get("authors_info", "")
+    snippet = paper.get("snippet", "")
+    doi = paper.get("doi")
+    venue = paper.get("venue")
+    year = paper.get("year")
+
+    with st.expander(f"📄 {title or 'Untitled'}", expanded=expanded):
+        if authors_info:
+            st.markdown(f"**Authors:** {authors_info}")
+        if venue or year:
+            st.markdown(f"**Venue / Year:** {venue or '—'} — {year or '—'}")
+        if snippet:
+            st.markdown(f"**Abstract (source):** {snippet}")
+        if "local_score" in paper:
+            st.markdown(f"**Local pre-rank score:** `{paper['local_score']:.2f}`")
+
+        if url:
+            st.markdown(f"[🔗 View Paper]({url})")
+            doi_or_url = f"https://doi.org/{doi}" if doi else url
+            inst1 = with_ntu_proxy(doi_or_url, style=1)
+            inst2 = with_ntu_proxy(doi_or_url, style=2)
+            if inst1:
+                st.markdown(f"[🏫 NTU Access (style 1)]({inst1})")
+            if inst2:
+                st.markdown(f"[🏫 NTU Access (style 2)]({inst2})")
+
+        # Unified Gemini annotation (computed by the worker pool)
+        if res["error"]:
+            st.error(f"Gemini API error: {res['error']}")
+        abstract_ai, tags, score3 = res["abstract_ai"], res["tags"], res["score3"]
+
+        if abstract_ai:
+            st.markdown("**Abstract (AI):**")
+            st.write(abstract_ai)
+        if tags:
+            st.markdown("**🏷️ Tags:** " + ", ".join(tags))
+        st.markdown(f"**AI Relevance (0–3):** `{score3}`")
+        if res["triaged"]:
+            st.caption(f"🪜 Triage score below {full_from}: PDF and full annotation skipped.")
+
+        selected = False
+        if select_default is not None:
+            selected = st.checkbox("📥 Select for Zotero", value=select_default, key=select_key)
+        return st.empty(), selected
+
+def zotero_item(paper: dict, res: dict) -> dict:
+    """Zotero journalArticle for a paper and its annotation, with consistent metadata."""
+    doi, url = paper.get("doi"), paper.get("url", "")
+    doi_or_url = f"https://doi.org/{doi}" if doi else url
+    proxy_url = with_ntu_proxy(doi_or_url, style=1) or with_ntu_proxy(doi_or_url, style=2) or url
+    year = paper.get("year")
+    item = {
+        'itemType': 'journalArticle',
+        'title': paper.get("title", ""),
+        'creators': parse_authors(paper.get("authors_info") or ""),
+        'abstractNote': res["abstract_ai"] or paper.get("snippet", ""),
+        'tags': [{'tag': t} for t in (res["tags"] or [])],
+        'url': proxy_url,
+        'date': str(year) if year else None,
+        'DOI': doi,
+        'collections': [user_zotero_collection]
+    }
+    return {k: v for k, v in item.items() if v not in (None, "")}
+
+def zotero_connect():
+    """(client, duplicate index) for the entered credentials; (None, None) when Zotero is off or unusable."""
+    if not (add_to_zotero and user_zotero_key and user_zotero_id):
+        return None, None
+    try:
+        zot = zotero.Zotero(user_zotero_id, 'user', user_zotero_key)
+    except Exception as e:
+        st.error(f"Zotero initialization error: {e}")
+        return None, None
+    zot_index = None
+    if not allow_duplicates or attach_pdfs:
+        # local DOI/title/file index, brought up to date with one request when nothing changed
+        try:
+            zot_index = zotero_index(user_zotero_id, user_zotero_key)
+            zot_index.sync()
+        except Exception as e:
+            st.warning(f"⚠️ Zotero duplicate index could not be synced: {e}")
+            zot_index = None
+    return zot, zot_index
+
+def save_to_zotero(entries, zot, zot_index, outcomes: dict, status):
+    """
+    Zotero stage for [(entry, slot)]: duplicate check (library index + this batch), bulk create, optional
+    PDF attachments. Each outcome is shown in its slot and kept in `outcomes` by entry id, so reruns
+    show it without saving again. Ends with a summary caption.
+    """
+    queue, queued, duplicates = [], set(), 0
+    for entry, slot in entries:
+        paper, res = entry["paper"], entry["res"]
+        title, doi = paper.get("title", ""), paper.get("doi")
+        identity = paper_identity(title, doi)
+        if not allow_duplicates and (bool(zot_index and zot_index.find(title, doi)) or identity in queued):
+            outcomes[entry["id"]] = ("warning", f"⚠️ Skipped Zotero save: duplicate found for '{title}'")
+            slot.warning(outcomes[entry["id"]][1])
+            duplicates += 1
+            continue
+        slot.info(f"📥 Queued for Zotero (score3={res['score3']})")
+        queue.append((zotero_item(paper, res), slot, res["score3"], paper.get("pdf_url") or paper.get("url", ""),
+                      entry["id"]))
+        queued.add(identity)
+
+    if not queue:
+        if duplicates:
+            st.caption(f"📥 Zotero: nothing new to add, {duplicates} duplicates skipped")
+        return
+    status.info(f"📥 Saving {len(queue)} items to Zotero…")
+    created, errors, n_requests = zotero_create_batched(zot, [job[0] for job in queue], index=zot_index)
+    attached = {}
+    if attach_pdfs and created:
+        status.info(f"📎 Attaching PDFs to {len(created)} Zotero items…")
+        attached = zotero_attach_pdfs(lambda: zotero.Zotero(user_zotero_id, 'user', user_zotero_key),
+                                      [(created[i]["key"], queue[i][3]) for i in sorted(created)],
+                                      zot_index)
+    for i, (item, slot, score3, _, entry_id) in enumerate(queue):
+        if i in created:
+            if zot_index:
+                zot_index.add(created[i]["key"], created[i].get("data") or item)
+            pdf = attached.get(created[i]["key"])
+            note = {None: "", "attached": " · 📎 PDF attached", "duplicate": " · 📎 PDF already in library",
+                    "not downloaded": ""}.get(pdf, f" · ⚠️ PDF upload failed: {pdf}")
+            outcomes[entry_id] = ("success", f"✅ Added to Zotero (score3={score3}){note}")
+        else:
+            outcomes[entry_id] = ("error", f"❌ Zotero error: {errors.get(i, 'not saved')}")
+        getattr(slot, outcomes[entry_id][0])(outcomes[entry_id][1])
+    summary = (f"📥 Zotero: {len(created)} added, {len(errors)} failed, {duplicates} duplicates "
+               f"skipped ({n_requests} write requests)")
+    if attached:
+        outcome = Counter(v if v in ("attached", "duplicate", "not downloaded") else "failed"
+                          for v in attached.values())
+        summary += (f" · PDFs: {outcome['attached']} attached, {outcome['duplicate']} already stored, "
+                    f"{outcome['not downloaded']} not downloaded, {outcome['failed']} failed")
+    (st.warning if errors else st.caption)(summary)
+
+def show_run(run: dict):
+    """
+    Re-render the session's last results without searching or annotating again. Only what the changed
+    widgets affect is redone: triaged papers that a lowered threshold (or a disabled cascade) now sends to
+    full annotation, and Zotero saves of the papers ticked here.
+    """
+    status = st.empty()
+    full_from = cascade_full_from()
+    stale = [e for e in run["papers"] if e["res"]["triaged"] and (full_from is None or e["res"]["score3"] >= full_from)]
+    if stale and GEMINI_API_KEY:
+        status.info(f"🪜 Full annotation for {len(stale)} papers now at or above the threshold…")
+        jobs = ((e["paper"], e["query"]) for e in stale)
+        for e, (_, res) in zip(stale, iter_annotated(jobs, workers=annotation_workers,
+                                                     batch_size=BATCH_SIZE if batch_gemini else 1,
+                                                     full_from=full_from)):
+            e["res"] = {k: v for k, v in res.items() if k != "pdf_text"}
+        run["full_from"] = full_from
+    status.empty()
+
+    st.caption(f"🗂️ {len(run['papers'])} papers from this session's last run"
+               + (f" for `{run['query']}`" if run["query"] else "") + " — press Go to search again.")
+    can_save = bool(add_to_zotero and user_zotero_key and user_zotero_id and user_zotero_collection)
+    threshold = zotero_threshold()
+    selected = []
+    for e in run["papers"]:
+        saved = run["zotero"].get(e["id"])
+        choose = can_save and (not saved or saved[0] == "error")
+        slot, ticked = render_paper(e["paper"], e["res"], run["full_from"], expanded=run["expanded"],
+                                    select_default=e["res"]["score3"] >= threshold if choose else None,
+                                    select_key=f"zotero-select:{run['id']}:{threshold}:{e['id']}")
+        if saved:
+            getattr(slot, saved[0])(saved[1])
+        if ticked:
+            selected.append((e, slot))
+    if can_save and st.button(f"📥 Save selected to Zotero ({len(selected)})", disabled=not selected):
+        zot, zot_index = zotero_connect()
+        if zot:
+            save_to_zotero(selected, zot, zot_index, run["zotero"], status)
+            status.empty()
+
 # ============================
 # MAIN ACTION
 # ============================
-if st.button("🚀 Go"):
+run = st.session_state.get("run")  # last results of this session (see show_run)
+go = st.button("🚀 Go")
+edited_query = None
+if run and run["query"] and not go and search_mode == "Keyword Search":
+    st.session_state.setdefault("edited_query", run["query"])
+    edited_query = st.text_area(QUERY_LABEL, key="edited_query")
+    if not st.button("🔁 Re-search with edited query") or not edited_query.strip():
+        edited_query = None
+
+if go or edited_query:
     progress = st.progress(0)
     status = st.empty()
 
     papers_meta = []
+    http0 = http_client.stats()
+    resolver = IdentityResolver()  # cross-source duplicates are merged before any PDF fetch or Gemini call
+    ranker, skipped = None, new_skipped()  # local pre-ranking (Keyword Search)
     try:
         # 1) KEYWORD SEARCH
         if search_mode == "Keyword Search":
-            if not user_prompt or not user_prompt.strip():
+            if edited_query:
+                effective_query = edited_query  # "Re-search": the query box above, no Boolean rewrite
+            elif not user_prompt or not user_prompt.strip():
                 st.warning("Please enter a research topic.")
                 st.stop()
-
-            status.info("🧠 Preparing query…")
-            if use_boolean:
-                b = gemini_boolean_query(user_prompt)
-                effective_query = b.get("boolean_query") or build_boolean_query_simple(user_prompt)
-                if b.get("keywords"):
-                    st.caption("Keywords: " + ", ".join((b.get("keywords") or [])[:12]))
-                if b.get("year_from") or b.get("year_to"):
-                    st.caption(f"Years: {b.get('year_from')}–{b.get('year_to')}")
             else:
-                effective_query = build_boolean_query_simple(user_prompt)
+                status.info("🧠 Preparing query…")
+                if use_boolean:
+                    b = gemini_boolean_query(user_prompt)
+                    effective_query = b.get("boolean_query") or build_boolean_query_simple(user_prompt)
+                    if b.get("keywords"):
+                        st.caption("Keywords: " + ", ".join((b.get("keywords") or [])[:12]))
+                    if b.get("year_from") or b.get("year_to"):
+                        st.caption(f"Years: {b.get('year_from')}–{b.get('year_to')}")
+                else:
+                    effective_query = build_boolean_query_simple(user_prompt)
 
-            # Editable query box
-            effective_query = st.text_area("✏️ Editable search query (you can tweak before searching):", effective_query)
+                # Editable query box; results are kept, so editing it and pressing "Re-search" loses nothing
+                st.session_state["edited_query"] = effective_query
+                st.text_area(QUERY_LABEL, key="edited_query")
             progress.progress(10)
 
-            agg = []
+            providers = {}
             if search_source in ("Semantic Scholar", "Both"):
-                status.info("🔎 Searching Semantic Scholar…")
-                try:
-                    agg.extend(search_semantic_scholar(effective_query, limit=max_results))
-                except Exception as e:
-                    st.warning(f"Semantic Scholar failed: {e}")
-                progress.progress(30)
-
+                providers["Semantic Scholar"] = iter_semantic_scholar_bulk if deep_retrieval else search_semantic_scholar
             if search_source in ("PubMed", "Both"):
-                status.info("🧬 Searching PubMed…")
-                try:
-                    agg.extend(search_pubmed(effective_query, limit=max_results))
-                except Exception as e:
-                    st.warning(f"PubMed failed: {e}")
+                providers["PubMed"] = iter_pubmed_pages if deep_retrieval else search_pubmed
+
+            status.info("🔎 Searching " + " + ".join(providers) + "…")
+            if use_prerank:
+                ranker = prerank.Preranker(effective_query, prefs.get("topics"), prefs.get("authors"))
+            if deep_retrieval:
+                # pages stream into dedupe; without pre-ranking straight on to annotation, with it annotation starts
+                # once every page is ranked (the best matches may be on the last page)
+                pages = iter_deep_pages(providers, effective_query, max_candidates,
+                                        on_error=lambda name, err: st.warning(f"{name} failed: {err}"))
+                pages = iter_unique_pages((page for _, page in pages), max_candidates, resolver)
+                papers_meta = (iter_prerank(pages, ranker, prerank_top_k, prerank_cutoff, skipped) if ranker
+                               else chain.from_iterable(pages))
+                progress.progress(60)
+            else:
+                finished = []
+
+                def _provider_done(name, results, err):
+                    finished.append(name)
+                    if err:
+                        st.warning(f"{name} failed: {err}")
+                    else:
+                        status.info(f"✅ {name}: {len(results)} results" + (
+                            "" if len(finished) == len(providers) else " — waiting for the rest…"))
+                    progress.progress(10 + 40 * len(finished) // len(providers))
+
+                by_source, abandoned = fan_out_search(
+                    providers, effective_query, max_results,
+                    on_done=_provider_done, deadline=partial_deadline if allow_partial else None,
+                )
+                if abandoned:
+                    st.warning("⏱️ Continuing without: " + ", ".join(abandoned) + " (no answer in time)")
+                # keep provider order stable regardless of who finished first
+                agg = [r for name in providers for r in by_source.get(name, [])]
                 progress.progress(50)
 
-            status.info("📦 Combining results…")
-            papers_meta = _take(dedupe_results(agg), max_results)
-            progress.progress(60)
+                status.info("📦 Combining results…")
+                papers_meta = _take(dedupe_results(agg, resolver), max_results)
+                if ranker:
+                    papers_meta, rest = prerank_papers(papers_meta, ranker, prerank_top_k, prerank_cutoff)
+                    for p in rest:
+                        add_skipped(skipped, p)
+                progress.progress(60)
 
         # 2) PASTE CITATION / TEXT (Gemini extraction + PubMed + Google fallback; DOI→S2 if available)
         elif search_mode == "Paste citation / page text":
@@ -645,19 +1745,23 @@ if st.button("🚀 Go"):
                 st.stop()
 
             status.info("🔎 Enriching references…")
-            collected = []
-            for r in refs[:max_results]:
-                title, authors, year, doi = r.get("title"), r.get("authors"), r.get("year"), r.get("doi")
-                enriched = None
+            refs = refs[:max_results]
 
-                # 1. DOI → Semantic Scholar enrichment
-                if doi:
-                    enriched = semantic_scholar_by_doi(doi)
+            # 1. DOI / arXiv id → Semantic Scholar, all in one /paper/batch call
+            s2_ids = {i: (f"DOI:{r['doi']}" if r.get("doi") else f"ARXIV:{r['arxiv']}")
+                      for i, r in enumerate(refs) if r.get("doi") or r.get("arxiv")}
+            s2_hits = dict(zip(s2_ids, semantic_scholar_batch(list(s2_ids.values())))) if s2_ids else {}
+            progress.progress(40)
 
-                # 2. PubMed by title
-                if not enriched and title:
-                    pm = search_pubmed(title, 1)
-                    enriched = pm[0] if pm else None
+            # 2. Everything S2 did not resolve → PubMed by title, batched (a few NCBI calls in total)
+            pm_idx = [i for i, r in enumerate(refs) if not s2_hits.get(i) and r.get("title")]
+            pm_hits = dict(zip(pm_idx, pubmed_resolve_titles([refs[i]["title"] for i in pm_idx]))) if pm_idx else {}
+            progress.progress(50)
+
+            collected = []
+            for i, r in enumerate(refs):
+                title, authors, year, doi = r.get("title"), r.get("authors"), r.get("year"), r.get("doi")
+                enriched = s2_hits.get(i) or pm_hits.get(i)
 
                 # 3. Google fallback
                 if not enriched and title:
@@ -678,7 +1782,7 @@ if st.button("🚀 Go"):
                     }
                 collected.append(enriched)
 
-            papers_meta = collected
+            papers_meta = dedupe_results(collected, resolver)
             progress.progress(60)
 
         # 3) LOOKUP BY URL / DOI / PDF
@@ -692,15 +1796,14 @@ if st.button("🚀 Go"):
             progress.progress(10)
 
             if DOI_RE.fullmatch(val):
-                # DOI path: Crossref enrich + S2 by title if possible
+                # DOI path: Crossref enrich + S2 by DOI, by title if S2 does not know the DOI
                 doi = val
                 enr = crossref_enrich(doi)
                 title = enr.get("title")
-                if title:
-                    status.info("🔎 Searching Semantic Scholar by title…")
+                status.info("🔎 Looking up Semantic Scholar…")
+                ss = [p for p in semantic_scholar_batch([f"DOI:{doi}"]) if p]
+                if not ss and title:
                     ss = search_semantic_scholar(title, limit=1)
-                else:
-                    ss = []
                 base = {
                     "title": enr.get("title"),
                     "url": enr.get("url"),
@@ -715,9 +1818,9 @@ if st.button("🚀 Go"):
                 progress.progress(60)
             else:
                 # Assume URL
-                is_pdf, pdf_text = fetch_url_and_guess_pdf(val)
+                pdf_sha, pdf_text = fetch_url_and_guess_pdf(val)
                 progress.progress(25)
-                if is_pdf:
+                if pdf_sha:
                     status.info("📄 PDF detected — extracting metadata…")
                     md = extract_metadata_from_pdf_text(pdf_text)
                     doi = md.get("doi")
@@ -726,14 +1829,17 @@ if st.button("🚀 Go"):
                     else:
                         enr = {}
                     title = md.get("title") or enr.get("title")
-                    status.info("🔎 Searching Semantic Scholar by title…")
-                    ss = search_semantic_scholar(title, limit=1) if title else []
+                    status.info("🔎 Looking up Semantic Scholar…")
+                    ss = [p for p in semantic_scholar_batch([f"DOI:{doi}"]) if p] if doi else []
+                    if not ss and title:
+                        ss = search_semantic_scholar(title, limit=1)
                     base = {
                         "title": title,
                         "url": val,
                         "authors_info": md.get("authors_info") or enr.get("authors_info"),
                         "snippet": clean_snippet(pdf_text[:1200]),
                         "pdf_url": val,
+                        "pdf_sha": pdf_sha,
                         "doi": doi,
                         "venue": enr.get("venue"),
                         "year": enr.get("year"),
@@ -748,127 +1854,130 @@ if st.button("🚀 Go"):
                     progress.progress(70)
 
         # Initialize Zotero (optional)
-        if add_to_zotero and user_zotero_key and user_zotero_id:
-            try:
-                zot = zotero.Zotero(user_zotero_id, 'user', user_zotero_key)
-            except Exception as e:
-                st.error(f"Zotero initialization error: {e}")
-                zot = None
-        else:
-            zot = None
+        zot, zot_index = zotero_connect()
+
+        # Deep retrieval streams a generator: peek at the first paper so "nothing found" still works
+        if not isinstance(papers_meta, list):
+            first = next(papers_meta, None)
+            papers_meta = chain([first], papers_meta) if first else []
 
         # If nothing found — friendly message
         if not papers_meta:
+            st.session_state.pop("run", None)
             status.warning("")
             progress.progress(100)
             st.error("😅 We searched high, low, and even peered behind the paywall sofa cushions… but found nada.")
             st.caption("Try tweaking the query or switching modes. Even librarians have off days.")
+            if skipped["n"]:
+                st.caption(f"🎯 All {skipped['n']} candidates scored below the local pre-ranking cutoff "
+                           f"({prerank_cutoff:.2f}); lower it or turn pre-ranking off.")
             st.stop()
 
         # Render + Gemini analysis (UNIFIED)
         status.info("🧪 Analyzing and annotating…")
         progress.progress(75)
 
-        # Map Zotero threshold: score3 (0..3)
-        zotero_threshold_score3 = min(3, max(0, int(min_score3)))
-
-        for i, paper in enumerate(papers_meta):
-            title = paper.get("title", "")
-            url = paper.get("url", "")
-            authors_info = paper.get("authors_info", "")
-            snippet = paper.get("snippet", "")
-            pdf_url = paper.get("pdf_url", "")
-            doi = paper.get("doi")
-            venue = paper.get("venue")
-            year = paper.get("year")
-
-            # Pull PDF text when useful
-            pdf_text = extract_pdf_text(pdf_url or url)
-
-            with st.expander(f"📄 {title or 'Untitled'}", expanded=True):
-                if authors_info:
-                    st.markdown(f"**Authors:** {authors_info}")
-                if venue or year:
-                    st.markdown(f"**Venue / Year:** {venue or '—'} — {year or '—'}")
-                if snippet:
-                    st.markdown(f"**Abstract (source):** {snippet}")
-
-                if url:
-                    st.markdown(f"[🔗 View Paper]({url})")
-                    doi_or_url = f"https://doi.org/{doi}" if doi else url
-                    inst1 = with_ntu_proxy(doi_or_url, style=1)
-                    inst2 = with_ntu_proxy(doi_or_url, style=2)
-                    if inst1:
-                        st.markdown(f"[🏫 NTU Access (style 1)]({inst1})")
-                    if inst2:
-                        st.markdown(f"[🏫 NTU Access (style 2)]({inst2})")
-
-                # Unified Gemini annotation
-                user_query = (
-                    user_prompt if search_mode == 'Keyword Search' else
-                    (title or paste_text if search_mode == 'Paste citation / page text' else url_or_doi)
-                )
-
-                try:
-                    abstract_ai, tags, score3 = gemini_annotate_paper(
-                        title, authors_info, snippet, pdf_text, url, user_query
-                    ) if GEMINI_API_KEY else ("", [], 0)
-                except Exception as e:
-                    st.error(f"Gemini API error: {e}")
-                    abstract_ai, tags, score3 = "", [], 0
-
-                if abstract_ai:
-                    st.markdown("**Abstract (AI):**")
-                    st.write(abstract_ai)
-                if tags:
-                    st.markdown("**🏷️ Tags:** " + ", ".join(tags))
-                st.markdown(f"**AI Relevance (0–3):** `{score3}`")
-
-                # Zotero save with consistent metadata
-                if add_to_zotero and zot and user_zotero_collection and (score3 >= zotero_threshold_score3):
-                    doi_or_url = f"https://doi.org/{doi}" if doi else url
-                    proxy_url = with_ntu_proxy(doi_or_url, style=1) or with_ntu_proxy(doi_or_url, style=2) or url
-
-                    item = {
-                        'itemType': 'journalArticle',
-                        'title': title,
-                        'creators': parse_authors(authors_info),
-                        'abstractNote': abstract_ai or snippet,
-                        'tags': [{'tag': t} for t in (tags or [])],
-                        'url': proxy_url,
-                        'date': str(year) if year else None,
-                        'DOI': doi,
-                        'collections': [user_zotero_collection]
-                    }
-                    item = {k: v for k, v in item.items() if v not in (None, "")}
-
-                    duplicate_found = False
-                    if not allow_duplicates and title.strip():
-                        try:
-                            existing_items = zot.items(q=title, itemType="journalArticle")
-                            for existing in existing_items:
-                                t = existing.get("data", {}).get("title", "").strip().lower()
-                                if t == title.strip().lower():
-                                    duplicate_found = True
-                                    break
-                            if doi and not duplicate_found:
-                                existing2 = zot.items(q=doi, itemType="journalArticle")
-                                for ex in existing2:
-                                    if doi and (doi.lower() in json.dumps(ex.get("data", {})).lower()):
-                                        duplicate_found = True
-                                        break
-                        except Exception as e:
-                            st.warning(f"⚠️ Zotero duplicate check failed: {e}")
-
-                    if duplicate_found and not allow_duplicates:
-                        st.warning(f"⚠️ Skipped Zotero save: duplicate found for '{title}'")
-                    else:
-                        try:
-                            zot.create_items([item])
-                            st.success(f"✅ Added to Zotero (score3={score3})")
-                        except Exception as e:
-                            st.error(f"❌ Zotero error: {e}")
-
+        zotero_threshold_score3 = zotero_threshold()
+        full_from = cascade_full_from()
+
+        # Query used for scoring each paper
+        def _user_query_for(paper):
+            return (
+                user_prompt if search_mode == 'Keyword Search' else
+                (paper.get("title", "") or paste_text if search_mode == 'Paste citation / page text' else url_or_doi)
+            )
+
+        cache = annotation_cache()
+        hits0, misses0 = cache.hits, cache.misses
+        skips0 = pdf_tools.skip_stats()
+        usage0 = gemini_usage()
+        run_started = datetime.now().isoformat(timespec="seconds")
+
+        # PDF download + Gemini run concurrently; rendering stays on this thread, in ranking order
+        jobs = ((p, _user_query_for(p)) for p in papers_meta)
+        expected = (len(papers_meta) if isinstance(papers_meta, list)
+                    else min(max_candidates, prerank_top_k) if ranker else max_candidates)
+        n_annotated = n_triaged = 0
+        # kept in session state as results arrive, so a rerun (even mid-run) shows them instead of starting over
+        run = st.session_state["run"] = {"id": monotonic(),
+                                         "query": effective_query if search_mode == "Keyword Search" else None,
+                                         "papers": [], "full_from": full_from, "zotero": {},
+                                         "expanded": not deep_retrieval}
+        to_save = []
+        for i, (paper, res) in enumerate(iter_annotated(jobs, workers=annotation_workers,
+                                                             batch_size=BATCH_SIZE if batch_gemini else 1,
+                                                             full_from=full_from)):
+            # entry ids are unique within a run even when two results resolve to the same paper identity
+            entry = {"id": i, "paper": paper, "res": {k: v for k, v in res.items() if k != "pdf_text"},
+                     "query": _user_query_for(paper)}
+            run["papers"].append(entry)
+            slot, _ = render_paper(paper, res, full_from, expanded=not deep_retrieval)
+            n_triaged += res["triaged"]
+            if zot and user_zotero_collection and res["score3"] >= zotero_threshold_score3:
+                # written in bulk after the loop; the placeholder is filled in then
+                slot.info(f"📥 Queued for Zotero (score3={res['score3']})")
+                to_save.append((entry, slot))
+
+            n_annotated = i + 1
+            progress.progress(75 + int(24 * (i + 1) / max(expected, i + 1)))
+            if deep_retrieval:
+                status.info(f"🧪 Analyzing and annotating… {i + 1} papers so far")
+
+        if to_save:
+            save_to_zotero(to_save, zot, zot_index, run["zotero"], status)
+
+        use = {k: v - usage0.get(k, 0) for k, v in gemini_usage().items()}
+        calls = sum(v for k, v in use.items() if k.endswith(".calls"))
+        if calls:
+            st.caption(f"📦 Gemini: {calls} requests for {n_annotated} papers"
+                       + (" (batched)" if batch_gemini else ""))
+        if use.get("annotate.fitted"):
+            fields = {k.rsplit(".", 1)[1]: v / use["annotate.fitted"] for k, v in use.items()
+                      if k.startswith("annotate.field.")}
+            st.caption(f"✂️ Annotation prompts: ~{sum(fields.values()):,.0f} est. tokens of paper text each "
+                       f"(budget {prompt_budget.PAPER_PROMPT_TOKENS}; "
+                       + " · ".join(f"{k} {v:,.0f}" for k, v in fields.items()) + ")")
+            log = [e for e in gemini_prompt_log() if e["t"] >= run_started]
+            with st.expander(f"✂️ Prompt token log ({len(log)} requests)", expanded=False):
+                st.dataframe(log, use_container_width=True)
+        if n_triaged:
+            # a skipped full annotation would have cost what one costs on average (this run, else so far)
+            ref = use if use.get("annotate.papers") else gemini_usage()
+            n = ref.get("annotate.papers", 0)
+            saved = (f"~{n_triaged * ref['annotate.tokens'] / n:,.0f} tokens and "
+                     f"~{n_triaged * ref['annotate.seconds'] / n:.0f}s of {ANNOTATION_MODEL} time saved"
+                     if n else f"{n_triaged} full annotations saved")
+            st.caption(f"🪜 Cascade: {n_triaged} of {n_annotated} papers stopped at {TRIAGE_MODEL} triage; {saved} "
+                       f"(triage spent {use.get('triage.tokens', 0):,} tokens, {use.get('triage.seconds', 0):.0f}s)")
+        if ranker:
+            st.caption(f"🎯 Local pre-ranking: {n_annotated} of {ranker.n_docs} candidates sent to Gemini "
+                       f"(top K={prerank_top_k}, cutoff={prerank_cutoff:.2f}; terms: {', '.join(ranker.terms) or '—'})")
+            if skipped["n"]:
+                with st.expander(f"🎯 Not sent to Gemini ({skipped['n']})", expanded=False):
+                    near = [p for *_, p in sorted(skipped["near"], key=lambda it: it[:2], reverse=True)]
+                    st.dataframe([{"local score": p["local_score"], "title": p.get("title"), "year": p.get("year")}
+                                  for p in near], use_container_width=True)
+        if resolver.merged:
+            st.caption(f"🧬 Merged {resolver.merged} cross-source duplicates before annotation "
+                       f"({resolver.merged} annotation calls saved)")
+        st.caption(f"🗃️ Annotation cache this run: {cache.hits - hits0} hits · {cache.misses - misses0} misses")
+        skips = {k: v - skips0.get(k, 0) for k, v in pdf_tools.skip_stats().items()}
+        skipped_links = sum(v for k, v in skips.items() if k.startswith("skipped_"))
+        if skipped_links:
+            st.caption(f"⏭️ Skipped {skipped_links} non-PDF links: "
+                       f"{skips.get('skipped_landing', 0)} landing pages, "
+                       f"{skips.get('skipped_not_pdf', 0)} probed, {skips.get('skipped_known', 0)} remembered")
+        parse_failed = {k[len("parse_"):]: v for k, v in skips.items() if k.startswith("parse_") and v}
+        if parse_failed:
+            st.caption("🧯 PDFs not parsed: " + ", ".join(f"{v} {k}" for k, v in parse_failed.items()))
+        net = {k: v - http0.get(k, 0) for k, v in http_client.stats().items()}
+        if net.get("cache_hit") or net.get("cache_revalidated"):
+            st.caption(f"🗄️ API response cache: {net.get('cache_hit', 0)} answered locally, "
+                       f"{net.get('cache_revalidated', 0)} revalidated (304), {net.get('cache_stored', 0)} fetched")
+        resilience = {k: v for k, v in net.items() if not k.startswith("cache_")}
+        if any(resilience.values()):
+            st.caption(f"🛟 HTTP: {net.get('retries', 0)} retries, {net.get('breaker_rejected', 0)} fast-failed "
+                       f"(provider down), {net.get('hedged', 0)} hedged ({net.get('hedge_won', 0)} won)")
         status.success("Done ✅")
         progress.progress(100)
 
@@ -876,3 +1985,5 @@ if st.button("🚀 Go"):
         # Clear status after a short delay to avoid lingering messages
         sleep(0.4)
         status.empty()
+elif run:
+    show_run(run)
@@ -0,0 +1,140 @@
+# disk_cache.py — small persistent key/value store on SQLite (TTL + size-bounded LRU)
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+CACHE_DIR = os.environ.get("AI_LIT_CACHE_DIR", ".cache")
+
+
+def cache_key(*parts) -> str:
+    """Stable hex key for any JSON-serialisable parts (order matters, dict key order does not)."""
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    SQLite-backed cache. Values are JSON-serialisable objects or raw bytes.
+    - ttl: default lifetime in seconds (None = no expiry); set() may override per entry
+    - max_bytes: total stored size; least-recently-used entries are evicted beyond it
+    - on_evict(key, value): called for entries removed by expiry/eviction (e.g. to delete files)
+    WAL mode and short-lived connections keep it safe across threads and processes.
+    """
+
+    def __init__(self, path: str, *, ttl: float | None = None, max_bytes: int | None = None, on_evict=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, raw INTEGER NOT NULL,"
+                " size INTEGER NOT NULL, expires REAL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+
+    @contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA busy_timeout=30000")
+            yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _decode(value, raw):
+        return bytes(value) if raw else json.loads(value)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _drop(self, db, rows):
+        """Delete (key, value, raw) rows and notify on_evict."""
+        if not rows:
+            return
+        db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _, _ in rows])
+        if self.on_evict:
+            for k, v, raw in rows:
+                try:
+                    self.on_evict(k, self._decode(v, raw))
+                except Exception:
+                    pass
+
+    def get(self, key: str, default=None):
+        now = time.time()
+        with self._db() as db:
+            row = db.execute("SELECT value, raw, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(False)
+                return default
+            value, raw, expires = row
+            if expires is not None and expires <= now:
+                self._drop(db, [(key, value, raw)])
+                self._count(False)
+                return default
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        self._count(True)
+        return self._decode(value, raw)
+
+    def set(self, key: str, value, ttl: float | None = None, size: int | None = None):
+        """Store value; `size` overrides the accounted size (e.g. for a file the value only points to)."""
+        raw = isinstance(value, (bytes, bytearray, memoryview))
+        blob = bytes(value) if raw else json.dumps(value, ensure_ascii=False).encode("utf-8")
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with self._db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, raw, size, expires, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, blob, int(raw), len(blob) if size is None else size, now + ttl if ttl else None, now),
+            )
+            if self.max_bytes:
+                self._evict(db, now)
+
+    def delete(self, key: str):
+        with self._db() as db:
+            row = db.execute("SELECT key, value, raw FROM entries WHERE key = ?", (key,)).fetchone()
+            self._drop(db, [row] if row else [])
+
+    def _evict(self, db, now: float):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired = db.execute("SELECT key, value, raw FROM entries WHERE expires IS NOT NULL AND expires <= ?",
+                             (now,)).fetchall()
+        self._drop(db, expired)
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        # evict down to 90% so we do not evict again on the very next write
+        target, victims = int(self.max_bytes * 0.9), []
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed ASC"):
+            if total <= target:
+                break
+            victims.append(key)
+            total -= size
+        rows = [db.execute("SELECT key, value, raw FROM entries WHERE key = ?", (k,)).fetchone() for k in victims]
+        self._drop(db, [r for r in rows if r])
+
+    def clear(self):
+        with self._db() as db:
+            rows = db.execute("SELECT key, value, raw FROM entries").fetchall() if self.on_evict else []
+            self._drop(db, rows)
+            db.execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        with self._db() as db:
+            n, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": n, "bytes": size}
@@ -0,0 +1,382 @@
+# http_client.py — shared HTTP client: pooled sessions, per-provider rate limits and resilience
+#
+# Imported once per process, so every Streamlit session and worker thread shares the same
+# connection pools, token buckets and circuit breakers; concurrent work fills each provider's
+# quota without 429s, and a provider that is down fails fast instead of eating retries.
+# API responses are also cached on disk (SQLite), shared by every process and session.
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, parse_qsl
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from disk_cache import DiskCache, CACHE_DIR, cache_key
+
+USER_AGENT = "AI-Literature-Helper/1.0"
+POOL_MAXSIZE = 16  # keep-alive connections per host
+
+# host → provider name (rate limits and sessions are per provider)
+PROVIDER_HOSTS = {
+    "api.semanticscholar.org": "s2",
+    "eutils.ncbi.nlm.nih.gov": "ncbi",
+    "api.crossref.org": "crossref",
+    "www.googleapis.com": "google",
+}
+
+# requests/second; configure() adjusts ncbi/crossref once keys/contact are known
+RATE_LIMITS = {
+    "s2": 1.0,        # S2 API key: 1 rps
+    "ncbi": 3.0,      # 10 rps with NCBI_API_KEY
+    "crossref": 5.0,  # public pool; polite pool (mailto) is 10 rps
+    "google": 5.0,
+}
+# simultaneous requests in flight
+CONCURRENCY = {"crossref": 3}
+
+# retries after the first attempt; PDF hosts (provider None) get one
+RETRIES = {"s2": 3, "ncbi": 3, "crossref": 3, "google": 1, None: 1}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5     # s; full jitter over base * 2**attempt
+BACKOFF_CAP = 20.0     # s; also caps Retry-After
+BREAKER_THRESHOLD = 5  # consecutive failures that open a provider's circuit
+BREAKER_COOLDOWN = 30  # s before a single trial request is let through
+
+DAY = 24 * 3600
+# Response cache: (provider, path prefix, seconds a response is served without asking); first match wins,
+# anything unlisted (PDF hosts, NCBI epost) is never cached
+CACHE_TTLS = [
+    ("crossref", "/works/", 30 * DAY),                       # DOI metadata barely changes
+    ("s2", "/graph/v1/paper/search", DAY),                   # searches (incl. bulk pages): index updates daily
+    ("s2", "/graph/v1/paper/", 7 * DAY),                     # DOI lookups and /paper/batch
+    ("ncbi", "/entrez/eutils/esearch.fcgi", DAY),
+    ("ncbi", "/entrez/eutils/efetch.fcgi", 30 * DAY),          # id lists only: history pages are streamed
+    ("google", "/customsearch/", DAY),
+]
+CACHE_KEEP_STALE = 7 * DAY             # stale entries stay this long for ETag/Last-Modified revalidation
+CACHE_MAX_BYTES = 256 * 1024 * 1024    # LRU-evicted beyond this
+SECRET_PARAMS = {"api_key", "key", "email", "tool", "mailto"}  # never part of a key: users share entries
+SESSION_PARAMS = {"usehistory", "WebEnv", "query_key"}          # NCBI history server: bound to a session
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without touching the network while a provider's circuit is open."""
+
+
+class CircuitBreaker:
+    """Closed → open after `threshold` consecutive failures → half-open (one trial) after `cooldown`."""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.cooldown:
+                self.trial = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.failures, self.opened_at, self.trial = 0, None, False
+                return
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at, self.trial = time.monotonic(), False
+
+
+class TokenBucket:
+    """Token bucket: refills at `rate` tokens/s up to `capacity`; acquire() blocks until a token is free."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+_lock = threading.Lock()
+_sessions: dict[str, requests.Session] = {}
+_buckets = {name: TokenBucket(rate) for name, rate in RATE_LIMITS.items()}
+_slots = {name: threading.BoundedSemaphore(n) for name, n in CONCURRENCY.items()}
+_breakers = {name: CircuitBreaker() for name in PROVIDER_HOSTS.values()}
+_mailto = None  # contact address; only Crossref ever sees it
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+_hedge_after = None
+_stats = Counter()
+_stats_lock = threading.Lock()
+_responses = DiskCache(os.path.join(CACHE_DIR, "http.sqlite"), max_bytes=CACHE_MAX_BYTES)
+
+
+def _bump(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats() -> dict:
+    """Cumulative counts: retries, breaker_rejected, hedged, hedge_won, cache_hit, cache_revalidated, cache_stored."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def configure(*, ncbi_api_key: str | None = None, mailto: str | None = None, hedge_after: float | None = None):
+    """
+    Apply credentials-dependent limits. Safe to call on every Streamlit rerun.
+    hedge_after: if set, API GETs still unanswered after this many seconds get a duplicate request.
+    """
+    global _hedge_after, _mailto
+    _hedge_after = hedge_after
+    _mailto = mailto or None
+    _buckets["ncbi"].rate = 10.0 if ncbi_api_key else 3.0
+    _buckets["crossref"].rate = 10.0 if mailto else 5.0
+
+
+def provider_for(url: str) -> str | None:
+    return PROVIDER_HOSTS.get((urlsplit(url).hostname or "").lower())
+
+
+def session_for(provider: str | None) -> requests.Session:
+    """
+    One keep-alive session per API provider; everything else (PDF hosts) shares a default session.
+    Only the Crossref session identifies the contact address (its polite pool); no other host is sent it.
+    """
+    name = provider or "default"
+    with _lock:
+        sess = _sessions.get(name)
+        if sess is None:
+            sess = requests.Session()
+            adapter = HTTPAdapter(pool_connections=64 if name == "default" else 4, pool_maxsize=POOL_MAXSIZE)
+            sess.mount("https://", adapter)
+            sess.mount("http://", adapter)
+            _sessions[name] = sess
+    polite = name == "crossref" and _mailto
+    sess.headers["User-Agent"] = f"{USER_AGENT} (mailto:{_mailto})" if polite else USER_AGENT
+    return sess
+
+
+def _send(method: str, url: str, provider: str | None, kwargs: dict) -> requests.Response:
+    """One attempt: wait for the provider's rate limit and a concurrency slot, then send."""
+    bucket, slot = _buckets.get(provider), _slots.get(provider)
+    if bucket:
+        bucket.acquire()
+    if slot:
+        slot.acquire()
+    try:
+        return session_for(provider).request(method, url, **kwargs)
+    finally:
+        if slot:
+            slot.release()
+
+
+def _close_quietly(fut):
+    try:
+        fut.result().close()
+    except Exception:
+        pass
+
+
+def _send_hedged(method: str, url: str, provider: str | None, kwargs: dict, hedge_after: float):
+    """Send; if no answer within `hedge_after` s, race a duplicate and keep whichever answers first."""
+    first = _hedge_pool.submit(_send, method, url, provider, kwargs)
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+    _bump("hedged")
+    second = _hedge_pool.submit(_send, method, url, provider, kwargs)
+    done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+    winner = next(iter(done))
+    loser = second if winner is first else first
+    if winner.exception() is not None:
+        return loser.result()  # the other one is our last chance
+    loser.add_done_callback(_close_quietly)  # give its connection back to the pool
+    if winner is second:
+        _bump("hedge_won")
+    return winner.result()
+
+
+def _retry_after(resp: requests.Response) -> float | None:
+    value = (resp.headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def _pairs(value) -> list[tuple[str, str]]:
+    """params/data as (name, value) pairs; anything else (raw bodies) → []."""
+    if isinstance(value, dict):
+        value = value.items()
+    elif not isinstance(value, (list, tuple)):
+        return []
+    return [(str(k), str(v)) for k, v in value if v is not None]
+
+
+def cache_ttl_for(method: str, url: str, provider: str | None, kwargs: dict) -> float | None:
+    """Freshness lifetime for this request from CACHE_TTLS, or None if it must not be cached."""
+    if method not in ("GET", "POST") or kwargs.get("stream") or not provider:
+        return None
+    parts = urlsplit(url)
+    ttl = next((t for p, prefix, t in CACHE_TTLS if p == provider and parts.path.startswith(prefix)), None)
+    names = {k for k, _ in parse_qsl(parts.query) + _pairs(kwargs.get("params")) + _pairs(kwargs.get("data"))}
+    return None if ttl is None or names & SESSION_PARAMS else ttl
+
+
+def _response_key(method: str, url: str, kwargs: dict) -> str:
+    """The normalized request: method, URL, sorted params/form fields without credentials, JSON body."""
+    parts = urlsplit(url)
+    fields = [(k, v) for k, v in parse_qsl(parts.query) + _pairs(kwargs.get("params")) if k not in SECRET_PARAMS]
+    data = kwargs.get("data")
+    if isinstance(data, (dict, list, tuple)):
+        data = sorted((k, v) for k, v in _pairs(data) if k not in SECRET_PARAMS)
+    elif isinstance(data, bytes):
+        data = data.decode("utf-8", "replace")
+    return cache_key(method, f"{parts.scheme}://{parts.netloc.lower()}{parts.path}", sorted(fields), data,
+                     kwargs.get("json"))
+
+
+def _cached(key: str) -> tuple[dict, bytes] | None:
+    blob = _responses.get(key)
+    if blob is None:
+        return None
+    head, _, body = blob.partition(b"\n")
+    return json.loads(head), body
+
+
+def _store(key: str, meta: dict, body: bytes, ttl: float):
+    # one raw value: a JSON header line, then the body as received
+    _responses.set(key, json.dumps(meta).encode("utf-8") + b"\n" + body, ttl=ttl + CACHE_KEEP_STALE)
+
+
+def _replay(meta: dict, body: bytes) -> requests.Response:
+    """A requests.Response rebuilt from a cache entry (status, headers, body, final URL)."""
+    resp = requests.Response()
+    resp.status_code, resp.reason, resp.url, resp._content = meta["status"], "OK", meta["url"], body
+    resp.headers = CaseInsensitiveDict(meta["headers"])
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    return resp
+
+
+def request(method: str, url: str, *, provider: str | None = None, retries: int | None = None,
+            hedge_after: float | None = None, cache_ttl: float | None = None, **kwargs) -> requests.Response:
+    """
+    requests-compatible call shared by every provider:
+    - answers from the shared response cache while an entry is fresh (CACHE_TTLS per endpoint, or
+      cache_ttl; 0 = bypass), then revalidates it with If-None-Match / If-Modified-Since where the
+      provider sent an ETag / Last-Modified
+    - waits for the provider's rate limit and reuses pooled connections
+    - retries connection errors and 429/5xx with full-jitter backoff, honouring Retry-After
+    - fails fast with CircuitOpenError while the provider's circuit is open
+    - optionally hedges idempotent, non-streamed GETs (hedge_after, or the configure() default)
+    Other statuses are returned as-is; callers still raise_for_status(). Only 200s are cached.
+    """
+    provider = provider or provider_for(url)
+    ttl = cache_ttl_for(method, url, provider, kwargs) if cache_ttl is None else cache_ttl
+    if not ttl:
+        return _request(method, url, provider, retries, hedge_after, kwargs)
+
+    key = _response_key(method, url, kwargs)
+    hit = _cached(key)
+    if hit:
+        meta, body = hit
+        if time.time() - meta["fetched"] < ttl:
+            _bump("cache_hit")
+            return _replay(meta, body)
+        validators = {"If-None-Match": meta["headers"].get("ETag"),
+                      "If-Modified-Since": meta["headers"].get("Last-Modified")}
+        validators = {k: v for k, v in validators.items() if v}
+        if validators:
+            kwargs = {**kwargs, "headers": {**(kwargs.get("headers") or {}), **validators}}
+
+    resp = _request(method, url, provider, retries, hedge_after, kwargs)
+    if hit and resp.status_code == 304:
+        _bump("cache_revalidated")
+        resp.close()
+        meta["fetched"] = time.time()
+        _store(key, meta, body, ttl)
+        return _replay(meta, body)
+    if resp.status_code == 200 and "no-store" not in resp.headers.get("Cache-Control", ""):
+        headers = {k: resp.headers[k] for k in ("Content-Type", "ETag", "Last-Modified") if k in resp.headers}
+        _store(key, {"status": 200, "url": resp.url, "headers": headers, "fetched": time.time()}, resp.content, ttl)
+        _bump("cache_stored")
+    return resp
+
+
+def _request(method: str, url: str, provider: str | None, retries: int | None, hedge_after: float | None,
+             kwargs: dict) -> requests.Response:
+    """The network part of request(): rate limit, circuit breaker, retries, hedging."""
+    retries = RETRIES.get(provider, 1) if retries is None else retries
+    breaker = _breakers.get(provider)
+    if hedge_after is None and provider and method == "GET" and not kwargs.get("stream"):
+        hedge_after = _hedge_after
+
+    for attempt in range(retries + 1):
+        if breaker and not breaker.allow():
+            _bump("breaker_rejected")
+            raise CircuitOpenError(f"{provider} is failing; skipping requests for up to {breaker.cooldown:.0f}s")
+        delay = None
+        try:
+            resp = (_send_hedged(method, url, provider, kwargs, hedge_after) if hedge_after
+                    else _send(method, url, provider, kwargs))
+        except (requests.ConnectionError, requests.Timeout):
+            if breaker:
+                breaker.record(False)
+            if attempt == retries:
+                raise
+        except Exception:
+            if breaker:
+                breaker.record(True)  # our fault (bad URL etc.), not the provider's; frees a half-open trial
+            raise
+        else:
+            if resp.status_code not in RETRY_STATUSES:
+                if breaker:
+                    breaker.record(True)
+                return resp
+            if breaker:
+                breaker.record(resp.status_code == 429)  # throttled is not down
+            if attempt == retries:
+                return resp
+            delay = _retry_after(resp)
+            resp.close()
+        _bump("retries")
+        backoff = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        time.sleep(min(BACKOFF_CAP, max(delay or 0.0, backoff)))
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
@@ -0,0 +1,178 @@
+# identity.py — cross-source paper identity: normalized ids + MinHash/LSH near-duplicate titles
+import re
+import zlib
+from urllib.parse import unquote
+
+import numpy as np
+
+NGRAM = 3              # character shingles
+NUM_PERM = 64          # MinHash signature length
+BANDS = 16             # 16 bands × 4 rows: a pair at Jaccard 0.8 shares a band >99.9% of the time
+TITLE_JACCARD = 0.8    # trigram Jaccard at which two titles count as the same paper
+MIN_TITLE_CHARS = 16   # shorter titles ("Editorial", "Reply") only ever merge on ids
+
+_ROMAN_RE = re.compile(r"^(?=[ivx]+$)x{0,3}(ix|iv|v?i{0,3})$")  # "part ii", "phase iv"
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0x5EED)  # fixed, so signatures are stable across runs
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def normalize_doi(doi: str | None) -> str:
+    doi = unquote((doi or "").strip()).lower()
+    doi = re.sub(r"^(https?://(dx\.)?doi\.org/|doi:\s*)", "", doi)
+    return doi.rstrip(".,;")
+
+
+def normalize_pmid(pmid) -> str:
+    return re.sub(r"\D", "", str(pmid or "")).lstrip("0")
+
+
+def normalize_title(title: str | None) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^0-9a-z]+", " ", (title or "").lower())).strip()
+
+
+def shingles(text: str, n: int = NGRAM) -> set[str]:
+    text = f" {text} "
+    return {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+
+
+def minhash(sh: set[str]) -> np.ndarray:
+    """NUM_PERM-long MinHash signature of a shingle set (crc32, then universal hashing mod a Mersenne prime)."""
+    h = np.fromiter((zlib.crc32(s.encode("utf-8")) & _PRIME for s in sh), dtype=np.uint64, count=len(sh))
+    return ((np.outer(_A, h) + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def title_markers(title: str) -> set[str]:
+    """Tokens of a normalized title that tell look-alike papers apart: anything with a digit, roman numerals."""
+    return {t for t in title.split() if any(c.isdigit() for c in t) or _ROMAN_RE.match(t)}
+
+
+def merge_records(into: dict, other: dict) -> dict:
+    """Fill gaps in `into` from `other`: missing fields, the longer snippet/author list, the larger citation count."""
+    for k, v in other.items():
+        if v in (None, "", []):
+            continue
+        cur = into.get(k)
+        if cur in (None, "", []):
+            into[k] = v
+        elif k in ("snippet", "authors_info") and isinstance(v, str) and len(v) > len(cur):
+            into[k] = v
+        elif k == "citationCount" and isinstance(v, int) and isinstance(cur, int) and v > cur:
+            into[k] = v
+    return into
+
+
+def _compatible(a: dict, b: dict) -> bool:
+    """
+    Title look-alikes are not merged when their ids disagree, they are more than a year apart, or they
+    are two different records of the same provider (one source never lists a paper twice).
+    """
+    if a.get("source") and a.get("source") == b.get("source"):
+        for field in ("url", "s2_id"):
+            x, y = (a.get(field) or "").strip().lower(), (b.get(field) or "").strip().lower()
+            if x and y and x != y:
+                return False
+    for field, norm in (("doi", normalize_doi), ("pmid", normalize_pmid)):
+        x, y = norm(a.get(field)), norm(b.get(field))
+        if x and y and x != y:
+            return False
+    try:
+        if a.get("year") and b.get("year") and abs(int(a["year"]) - int(b["year"])) > 1:
+            return False
+    except (TypeError, ValueError):
+        pass
+    return True
+
+
+class IdentityResolver:
+    """
+    Incremental duplicate detection over result dicts from any provider, in three steps:
+    1. exact match on normalized DOI, PMID or URL;
+    2. near-duplicate titles: MinHash over character trigrams, LSH-banded so a new record is only
+       compared with the few earlier ones sharing a band (roughly linear overall), then confirmed
+       with the exact trigram Jaccard and identical numbers/roman numerals ("part I" ≠ "part II");
+    3. a duplicate is merged into the first-seen record (merge_records) rather than kept.
+    `records` holds the survivors in arrival order; `merged` counts the duplicates folded in.
+    """
+
+    def __init__(self):
+        self.records: list[dict] = []
+        self.merged = 0
+        self._ids: dict[str, int] = {}             # "doi:…" / "pmid:…" / "url:…" → record index
+        self._titles: list[str] = []               # normalized title per record
+        self._sigs = np.zeros((64, NUM_PERM), dtype=np.uint64)  # MinHash per record (grown by doubling)
+        self._bands: dict[tuple, list[int]] = {}   # (band, signature slice) → record indexes
+
+    @staticmethod
+    def _keys(r: dict) -> list[str]:
+        keys = []
+        if doi := normalize_doi(r.get("doi")):
+            keys.append(f"doi:{doi}")
+        if pmid := normalize_pmid(r.get("pmid")):
+            keys.append(f"pmid:{pmid}")
+        if url := (r.get("url") or "").strip().lower():
+            keys.append(f"url:{url}")
+        return keys
+
+    @staticmethod
+    def _band_keys(sig: np.ndarray) -> list[tuple]:
+        rows = NUM_PERM // BANDS
+        return [(b, sig[b * rows:(b + 1) * rows].tobytes()) for b in range(BANDS)]
+
+    def _near(self, r: dict, sh: set[str], sig: np.ndarray, bands: list[tuple]) -> int | None:
+        cands = sorted({idx for band in bands for idx in self._bands.get(band, ())})
+        if not cands:
+            return None
+        # estimated Jaccard for all candidates at once; only plausible ones get the exact check
+        est = (self._sigs[cands] == sig).mean(axis=1)
+        markers = title_markers(normalize_title(r.get("title")))
+        for j in np.argsort(-est, kind="stable"):
+            if est[j] < TITLE_JACCARD - 0.2:
+                break
+            idx = cands[j]
+            if (jaccard(sh, shingles(self._titles[idx])) >= TITLE_JACCARD
+                    and title_markers(self._titles[idx]) == markers and _compatible(self.records[idx], r)):
+                return idx
+        return None
+
+    def add(self, r: dict) -> dict | None:
+        """Return `r` if it is a new paper, or None after merging it into the copy already seen."""
+        keys = self._keys(r)
+        idx = next((self._ids[k] for k in keys if k in self._ids), None)
+        title = normalize_title(r.get("title"))
+        sig = bands = None
+        if idx is None and len(title) >= MIN_TITLE_CHARS:
+            sh = shingles(title)
+            sig = minhash(sh)
+            bands = self._band_keys(sig)
+            idx = self._near(r, sh, sig, bands)
+
+        if idx is not None:
+            merge_records(self.records[idx], r)
+            for k in keys:
+                self._ids.setdefault(k, idx)  # the survivor is now also known by the duplicate's ids
+            self.merged += 1
+            return None
+
+        idx = len(self.records)
+        self.records.append(r)
+        self._titles.append(title)
+        if idx >= len(self._sigs):
+            self._sigs = np.concatenate([self._sigs, np.zeros_like(self._sigs)])
+        if sig is not None:
+            self._sigs[idx] = sig
+        for k in keys:
+            self._ids[k] = idx
+        for band in bands or ():
+            self._bands.setdefault(band, []).append(idx)
+        return r
+
+    def extend(self, results) -> list[dict]:
+        """add() every result; returns the new (surviving) ones in order."""
+        return [r for r in results if self.add(r) is not None]
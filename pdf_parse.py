@@ -0,0 +1,153 @@
+# pdf_parse.py — PDF text extraction with PyMuPDF; runs inside pdf_tools' parse worker processes
+#
+# Deliberately free of network/cache imports so workers start fast; everything here takes a file path.
+import re
+import signal
+from collections import Counter
+
+import fitz  # PyMuPDF
+
+from prompt_budget import SECTION_HEADINGS, SECTION_OF
+
+PDF_MAX_PAGES = 30                        # extraction never looks further than this
+FRONT_PAGES = 4                           # abstract/introduction are looked for this far in
+BACK_PAGES = 6                            # conclusion is looked for this far back from the end
+
+# Section heading at the start of a line, optionally numbered; group 2 is any text after it on the line
+_HEADING_RE = re.compile(rf"^(?:\d+(?:\.\d+)*\.?|[IVX]+\.?)?\s*({SECTION_HEADINGS})\b[\s:.\-—–]*(.*)$", re.I)
+
+
+def extract_text(path: str, limit: int, max_pages: int = PDF_MAX_PAGES) -> str:
+    """Page text in order, stopping as soon as `limit` chars (or `max_pages`) are reached."""
+    with fitz.open(path) as doc:  # file-backed: MuPDF reads pages on demand
+        text, n = [], 0
+        for i in range(min(doc.page_count, max_pages)):
+            t = doc.load_page(i).get_text()
+            text.append(t)
+            n += len(t) + 1
+            if n >= limit:
+                break
+        return ("\n".join(text))[:limit]
+
+
+def _page_lines(page) -> list[tuple[str, float, bool, bool]]:
+    """(text, font size, bold, starts a block) per text line, in content order."""
+    out = []
+    for block in page.get_text("dict", flags=fitz.TEXT_PRESERVE_WHITESPACE)["blocks"]:
+        for j, line in enumerate(block.get("lines", [])):
+            spans = [sp for sp in line["spans"] if sp["text"].strip()]
+            if spans:
+                text = " ".join(sp["text"].strip() for sp in spans)
+                out.append((text, max(sp["size"] for sp in spans), all(sp["flags"] & 16 for sp in spans), j == 0))
+    return out
+
+
+def _heading(line, body_size: float):
+    """(section | "other", inline rest) if the line opens a section, else None. Uses wording plus font cues."""
+    text, size, bold, first = line
+    emphasized = bold or size >= body_size + 1 or (text.isupper() and len(text) > 3)
+    m = _HEADING_RE.match(text)
+    if m and first:
+        name, rest = m.group(1).lower(), m.group(2).strip()
+        section = SECTION_OF.get(name) or "other"
+        if not rest and (emphasized or section == "abstract" or text[:1].isdigit()):
+            return section, ""
+        if rest and section == "abstract":  # "Abstract—We study …" / "ABSTRACT We study …"
+            return section, rest
+    if first and emphasized and len(text) <= 60 and not text.endswith(".") and size >= body_size:
+        return "other", ""  # some other heading (Methods, Related Work, …) ends the current section
+    return None
+
+
+def extract_sections(path: str, limit: int) -> str:
+    """
+    Abstract, introduction and conclusion within `limit` chars, found from headings (wording + font
+    size/bold from PyMuPDF spans). Only the first FRONT_PAGES pages and the last BACK_PAGES pages are
+    parsed, and the scan stops once a section is complete. Output keeps one heading line per section;
+    falls back to extract_text when no section is recognised.
+    """
+    caps = {"abstract": limit // 4, "introduction": limit, "conclusion": limit // 3}
+    found = {k: [] for k in caps}
+    sizes = Counter()
+    with fitz.open(path) as doc:
+        pages = {}
+
+        def lines_of(pno):
+            if pno not in pages:
+                pages[pno] = _page_lines(doc.load_page(pno))
+                for text, size, _, _ in pages[pno]:
+                    sizes[round(size)] += len(text)
+            return pages[pno]
+
+        def body_size():
+            return sizes.most_common(1)[0][0] if sizes else 10
+
+        def collect(pnos, wanted, stop_when):
+            """Walk pages, filling `found` for sections in `wanted`; returns when stop_when() is true."""
+            current = None
+            for pno in pnos:
+                for line in lines_of(pno):
+                    head = _heading(line, body_size())
+                    if head:
+                        current = head[0] if head[0] in wanted else None
+                        if current and head[1]:
+                            found[current].append(head[1])
+                        continue
+                    if current and sum(map(len, found[current])) < caps[current]:
+                        found[current].append(line[0])
+                if stop_when(current):
+                    return
+
+        n = min(doc.page_count, PDF_MAX_PAGES)
+        front = range(min(n, FRONT_PAGES))
+        collect(front, ("abstract", "introduction", "conclusion"),
+                lambda cur: found["introduction"] and cur != "introduction"
+                or sum(map(len, found["introduction"])) >= caps["introduction"])
+        if not found["conclusion"]:
+            back = range(max(0, doc.page_count - BACK_PAGES), doc.page_count)
+            start = next((p for p in reversed(back)
+                          if any((h := _heading(ln, body_size())) and h[0] == "conclusion" for ln in lines_of(p))),
+                         None)
+            if start is not None:
+                collect(range(start, doc.page_count), ("conclusion",),
+                        lambda cur: found["conclusion"] and cur != "conclusion")
+
+    if not any(found.values()):
+        return extract_text(path, limit)
+    text = {k: re.sub(r"-\s+(?=[a-z])", "", " ".join(v)).strip() for k, v in found.items()}  # re-join hyphenation
+    text["abstract"] = text["abstract"][:caps["abstract"]]
+    text["conclusion"] = text["conclusion"][:caps["conclusion"]]
+    text["introduction"] = text["introduction"][:max(0, limit - len(text["abstract"]) - len(text["conclusion"]) - 40)]
+    return "\n".join(f"{name.title()}\n{body}" for name, body in text.items() if body)
+
+
+
+class ParseTimeout(Exception):
+    """A document took longer than its parse budget."""
+
+
+def _alarm(signum, frame):
+    raise ParseTimeout()
+
+
+def limit_memory(max_bytes: int | None):
+    """Worker initializer: cap the process address space so a pathological PDF fails instead of exhausting RAM."""
+    try:
+        import resource  # POSIX only
+    except ImportError:
+        return
+    if max_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+
+
+def run_guarded(fn, path: str, limit: int, timeout: float) -> str:
+    """fn(path, limit) in a worker, interrupted with ParseTimeout after `timeout` s (where SIGALRM exists)."""
+    if not hasattr(signal, "setitimer"):
+        return fn(path, limit)
+    previous = signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(path, limit)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
@@ -0,0 +1,308 @@
+# pdf_tools.py — PDF download + text extraction behind a shared, content-addressed disk cache
+import atexit
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit
+
+import http_client
+import pdf_parse
+from disk_cache import DiskCache, CACHE_DIR
+
+PDF_DIR = os.path.join(CACHE_DIR, "pdf")
+PDF_CACHE_MAX_BYTES = 512 * 1024 * 1024   # downloaded PDFs, LRU-evicted beyond this
+TEXT_CACHE_MAX_BYTES = 64 * 1024 * 1024   # extracted text
+URL_CACHE_MAX_BYTES = 16 * 1024 * 1024    # URL → PDF hash / "not a PDF" records
+URL_TTL = 30 * 24 * 3600                  # URL records expire after this (not-PDF ones after PDF_REVALIDATE_AFTER)
+PDF_REVALIDATE_AFTER = 24 * 3600          # serve cached bytes without asking the server for a day
+TEXT_CHARS = 8000                         # text kept per PDF; callers slice to their own budget
+PDF_MAX_BYTES = 40 * 1024 * 1024          # larger downloads are abandoned mid-stream
+CHUNK = 64 * 1024
+PROBE_BYTES = 1024                        # enough to see the %PDF header
+PARSE_WORKERS = int(os.environ.get("AI_LIT_PARSE_WORKERS", os.cpu_count() or 2))  # 0 = parse in-process
+PARSE_TIMEOUT = 20                        # s per document before its worker is interrupted
+PARSE_MEMORY_BYTES = int(os.environ.get("AI_LIT_PARSE_MEMORY_MB", 1536)) * 1024 * 1024  # per worker
+PARSE_FAILED_TTL = 24 * 3600              # a PDF that timed out / ran out of memory is retried after this
+
+# Hosts that only ever serve HTML landing pages — never worth a request
+# matched exactly: pdfs.semanticscholar.org serves the real PDFs behind S2's openAccessPdf links
+LANDING_PAGE_HOSTS = {"pubmed.ncbi.nlm.nih.gov", "www.semanticscholar.org", "semanticscholar.org", "scholar.google.com"}
+
+
+def _blob_path(sha: str) -> str:
+    return os.path.join(PDF_DIR, sha[:2], f"{sha}.pdf")
+
+
+def _remove_blob(sha, meta):
+    try:
+        os.remove(_blob_path(sha))
+    except OSError:
+        pass
+
+
+# url → {sha, etag, last_modified, checked};  sha → {size} (accounted as the file size);  sha → text
+_urls = DiskCache(os.path.join(CACHE_DIR, "pdf_urls.sqlite"), ttl=URL_TTL, max_bytes=URL_CACHE_MAX_BYTES)
+_blobs = DiskCache(os.path.join(CACHE_DIR, "pdf_blobs.sqlite"), max_bytes=PDF_CACHE_MAX_BYTES, on_evict=_remove_blob)
+_texts = DiskCache(os.path.join(CACHE_DIR, "pdf_text.sqlite"), max_bytes=TEXT_CACHE_MAX_BYTES)
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _bump(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def skip_stats() -> dict:
+    """
+    Cumulative counts: skipped_landing (host list), skipped_known (remembered non-PDF), skipped_not_pdf (probe);
+    parse_timeout / parse_crashed / parse_memory / parse_failed for PDFs the parse workers gave up on.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def is_landing_page(url: str) -> bool:
+    host = (urlsplit(url).hostname or "").lower()
+    return host in LANDING_PAGE_HOSTS
+
+
+def looks_like_pdf(head: bytes) -> bool:
+    # the spec tolerates junk before the header within the first 1 KB
+    return b"%PDF" in head[:1024]
+
+
+def _spool(r, head: bytes) -> str | None:
+    """
+    Stream the rest of a response body (after the probed `head`) to a temp file in the blob store,
+    hashing as it goes. Returns the sha256, or None if the body exceeds PDF_MAX_BYTES.
+    """
+    length = r.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > PDF_MAX_BYTES:
+        return None
+    os.makedirs(PDF_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=PDF_DIR, suffix=".part")
+    h, size = hashlib.sha256(head), len(head)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(head)
+            for chunk in r.iter_content(CHUNK):
+                size += len(chunk)
+                if size > PDF_MAX_BYTES:
+                    return None
+                h.update(chunk)
+                f.write(chunk)
+        sha = h.hexdigest()
+        path = _blob_path(sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)  # atomic: concurrent writers of the same sha are harmless
+        tmp = None
+        _blobs.set(sha, {"size": size}, size=size)
+        return sha
+    finally:
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def download_pdf(url: str, timeout: float = 45) -> str | None:
+    """
+    Return the sha256 of the PDF at `url`, downloading it only when needed.
+    Cached copies are reused for PDF_REVALIDATE_AFTER, then revalidated with ETag/Last-Modified.
+    Returns None when the response is not a PDF: known landing-page hosts are skipped without a request,
+    anything else is probed on a streamed connection and dropped after PROBE_BYTES without a %PDF header.
+    """
+    if is_landing_page(url):
+        _bump("skipped_landing")
+        return None
+    now = time.time()
+    entry = _urls.get(url)
+    if entry and entry.get("not_pdf"):
+        if now - entry.get("checked", 0) < PDF_REVALIDATE_AFTER:
+            _bump("skipped_known")
+            return None
+        entry = None
+    if entry and not os.path.exists(_blob_path(entry["sha"])):
+        entry = None  # bytes were evicted
+    headers = {}
+    if entry:
+        if now - entry.get("checked", 0) < PDF_REVALIDATE_AFTER:
+            _blobs.get(entry["sha"])  # LRU touch
+            return entry["sha"]
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    with http_client.get(url, headers=headers, timeout=timeout, allow_redirects=True, stream=True) as r:
+        if r.status_code == 304 and entry:
+            _urls.set(url, entry | {"checked": now})
+            _blobs.get(entry["sha"])
+            return entry["sha"]
+        r.raise_for_status()
+        head = r.raw.read(PROBE_BYTES, decode_content=True)
+        if not looks_like_pdf(head):
+            _bump("skipped_not_pdf")
+            _urls.set(url, {"not_pdf": True, "content_type": r.headers.get("Content-Type"), "checked": now},
+                      ttl=PDF_REVALIDATE_AFTER)  # only ever trusted that long
+            return None  # leaving the with-block closes the connection mid-body
+        sha = _spool(r, head)
+    if not sha:
+        return None
+    _urls.set(url, {
+        "sha": sha,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "checked": now,
+    })
+    return sha
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# at most one document per worker in flight, so a submitted parse starts at once and the backstop
+# deadline in _parse measures parsing time, not time spent queued behind other documents
+_inflight = threading.BoundedSemaphore(max(1, PARSE_WORKERS))
+
+
+def _parse_pool() -> ProcessPoolExecutor | None:
+    """Process pool for CPU-bound parsing (spawned, memory-capped workers); created on first use."""
+    global _pool
+    if PARSE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=pdf_parse.limit_memory, initargs=(PARSE_MEMORY_BYTES,))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Kill a wedged or broken pool; the next parse starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        proc.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ParseUnavailable(Exception):
+    """Parsing failed for a reason not known to be the document's own; the failure is not cached."""
+
+
+def _parse(fn, sha: str, limit: int) -> str | None:
+    """
+    fn(path, limit) in the parse pool; only the file path crosses the process boundary.
+    Returns None if the document itself timed out or ran out of memory. A pool that broke while this
+    document was in flight may have been killed over another one, so it gets one more try on a fresh
+    pool; if that breaks too (or fn raised), ParseUnavailable, since the pool itself may be at fault
+    (spawn failure, an address-space limit too low for the interpreter).
+    """
+    path = _blob_path(sha)
+    if PARSE_WORKERS <= 0:
+        return fn(path, limit)
+    for attempt in range(2):
+        with _inflight:
+            pool = _parse_pool()
+            try:
+                fut = pool.submit(pdf_parse.run_guarded, fn, path, limit, PARSE_TIMEOUT)  # raises if already broken
+                return fut.result(timeout=PARSE_TIMEOUT + 10)  # backstop for a worker stuck inside MuPDF
+            except (pdf_parse.ParseTimeout, FutureTimeout):
+                _bump("parse_timeout")
+                if not fut.done():
+                    _discard_pool(pool)
+                return None
+            except (BrokenProcessPool, CancelledError):
+                _discard_pool(pool)
+            except MemoryError:
+                _bump("parse_memory")
+                return None
+            except Exception as e:
+                _bump("parse_failed")
+                raise ParseUnavailable(str(e)) from e
+    _bump("parse_crashed")
+    raise ParseUnavailable("parse worker crashed twice")
+
+
+def pdf_sections_for(sha: str, limit: int = TEXT_CHARS) -> str:
+    """Abstract / introduction / conclusion of a cached PDF within `limit` chars; parsed once per hash and limit."""
+    key = f"sections:{limit}:{sha}"
+    cached = _texts.get(key)
+    if cached is not None:
+        return cached["text"]
+    try:
+        text = _parse(pdf_parse.extract_sections, sha, limit)
+    except ParseUnavailable:
+        return ""
+    if text is None:
+        _texts.set(key, {"text": ""}, ttl=PARSE_FAILED_TTL)
+        return ""
+    _texts.set(key, {"text": text})
+    return text
+
+
+def pdf_text_for(sha: str, limit: int = TEXT_CHARS) -> str:
+    """Extracted text of a cached PDF (first `limit` chars); parsed once per content hash."""
+    cached = _texts.get(sha)
+    if cached is not None and (len(cached["text"]) >= limit or cached.get("complete")):
+        return cached["text"][:limit]
+    try:
+        text = _parse(pdf_parse.extract_text, sha, max(limit, TEXT_CHARS))
+    except ParseUnavailable:
+        return ""
+    if text is None:
+        _texts.set(sha, {"text": "", "complete": True}, ttl=PARSE_FAILED_TTL)
+        return ""
+    _texts.set(sha, {"text": text, "complete": len(text) < max(limit, TEXT_CHARS)})
+    return text[:limit]
+
+
+def fetch_pdf_text(url: str, limit: int = TEXT_CHARS, timeout: float = 45) -> tuple[bool, str]:
+    """Return (is_pdf, text[:limit]) for a URL, sharing downloaded bytes and parsed text across callers."""
+    sha = download_pdf(url, timeout=timeout)
+    if not sha:
+        return False, ""
+    return True, pdf_text_for(sha, limit)
+
+
+def fetch_pdf_sections(url: str, limit: int = TEXT_CHARS, timeout: float = 45) -> tuple[bool, str]:
+    """Like fetch_pdf_text, but returns the abstract/introduction/conclusion (see pdf_parse.extract_sections)."""
+    sha = download_pdf(url, timeout=timeout)
+    if not sha:
+        return False, ""
+    return True, pdf_sections_for(sha, limit)
+
+
+def cached_pdf(url: str) -> tuple[str, str] | None:
+    """(file path, md5) of the PDF already downloaded for `url`, without any request; None if not cached."""
+    entry = _urls.get(url) if url else None
+    if not entry or not entry.get("sha"):
+        return None
+    path = _blob_path(entry["sha"])
+    md5 = hashlib.md5()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK), b""):
+                md5.update(chunk)
+    except OSError:
+        return None  # evicted meanwhile
+    return path, md5.hexdigest()
+
+
+def cache_stats() -> dict:
+    return {"pdf": _blobs.stats(), "text": _texts.stats()}
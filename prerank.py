@@ -0,0 +1,77 @@
+# prerank.py — local lexical pre-ranking (BM25 over title + snippet) so only promising papers reach Gemini
+import re
+from collections import Counter
+
+import numpy as np
+
+K1, B = 1.2, 0.75
+TITLE_WEIGHT = 2      # title tokens are counted this many times
+TOPIC_BOOST = 0.15    # per priority topic whose words all occur in the paper (at most MAX_TOPIC_HITS)
+MAX_TOPIC_HITS = 2
+AUTHOR_BOOST = 0.25   # any priority author among the paper's authors
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is", "it", "its", "of",
+    "on", "or", "not", "that", "the", "their", "this", "to", "was", "were", "with", "via", "we", "using",
+}
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str | None) -> list[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def query_terms(query: str | None) -> list[str]:
+    """Positive terms of a Boolean query: NOT-ed words/phrases/groups, operators and [field] tags are dropped."""
+    q = re.sub(r"\[[^\]]*\]", " ", query or "")
+    q = re.sub(r'\bNOT\s+(\([^)]*\)|"[^"]*"|\S+)', " ", q)
+    return list(dict.fromkeys(tokenize(q)))
+
+
+class Preranker:
+    """
+    BM25 over title (weighted) + snippet for the positive terms of `query`, normalized to 0..1 by the
+    best score the query allows, plus boosts for priority topics/authors.
+    Corpus statistics (document frequencies, average length) accumulate across score() calls,
+    so pages streamed in one at a time are scored against everything seen so far.
+    """
+
+    def __init__(self, query: str, topics=(), authors=()):
+        self.terms = query_terms(query)
+        self.topics = [set(ws) for ws in map(tokenize, topics or ()) if ws]
+        self.authors = {ws[-1] for ws in map(tokenize, authors or ()) if ws}  # surnames
+        self.n_docs = 0
+        self.total_len = 0
+        self.df = np.zeros(len(self.terms))
+
+    def score(self, papers: list[dict]) -> np.ndarray:
+        if not papers:
+            return np.zeros(0)
+        docs = [tokenize(p.get("title")) * TITLE_WEIGHT + tokenize(p.get("snippet")) for p in papers]
+        counts = [Counter(d) for d in docs]
+        tf = np.array([[c.get(t, 0) for t in self.terms] for c in counts], dtype=float).reshape(len(docs), -1)
+        lens = np.array([len(d) for d in docs], dtype=float)
+
+        self.n_docs += len(docs)
+        self.total_len += int(lens.sum())
+        self.df += (tf > 0).sum(axis=0)
+        scores = np.zeros(len(docs))
+        if self.terms:
+            idf = np.log1p((self.n_docs - self.df + 0.5) / (self.df + 0.5))
+            avgdl = max(self.total_len / self.n_docs, 1.0)
+            sat = tf * (K1 + 1) / (tf + K1 * (1 - B + B * lens[:, None] / avgdl))
+            scores = (sat * idf).sum(axis=1) / ((K1 + 1) * idf).sum()
+
+        if self.topics:
+            hits = np.array([sum(t <= c.keys() for t in self.topics) for c in counts], dtype=float)
+            scores += TOPIC_BOOST * np.minimum(hits, MAX_TOPIC_HITS)
+        if self.authors:
+            scores += AUTHOR_BOOST * np.array(
+                [bool(self.authors & set(tokenize(p.get("authors_info")))) for p in papers], dtype=float)
+        return scores
+
+
+def select(scores: np.ndarray, top_k: int, cutoff: float) -> np.ndarray:
+    """Indexes of the (at most) top_k scores at or above cutoff, best first."""
+    order = np.argsort(-scores, kind="stable")
+    return order[scores[order] >= cutoff][:top_k]
@@ -0,0 +1,106 @@
+# prompt_budget.py — fit paper text into an annotation prompt's token budget, most useful parts first
+import re
+
+PAPER_PROMPT_TOKENS = 1200   # abstract + PDF sections per paper (title/authors/URL come on top)
+CHARS_PER_TOKEN = 4          # rough average for English prose
+OVERLAP_SHINGLE = 4          # words per shingle when matching PDF sentences against the abstract
+OVERLAP_MIN = 0.6            # a PDF sentence this much covered by the abstract is a repeat
+
+# Section headings recognised in paper text (also used by pdf_parse): a regex alternation, and what each
+# heading opens; headings not in SECTION_OF (methods, results) start body text
+SECTION_HEADINGS = (r"abstract|summary|introduction|background|conclusions?|concluding remarks|discussion|"
+                    r"methods?|materials and methods|results|references|bibliography|acknowledge?ments?")
+SECTION_OF = {
+    "abstract": "abstract", "summary": "abstract",
+    "introduction": "introduction", "background": "introduction",
+    "conclusion": "conclusion", "conclusions": "conclusion", "concluding remarks": "conclusion",
+    "discussion": "conclusion",
+    "references": None, "bibliography": None,  # never worth prompt space
+}
+# Section heading on its own line, optionally numbered ("1. Introduction", "IV CONCLUSIONS")
+_HEADING_RE = re.compile(rf"^\s*(?:\d+(?:\.\d+)*\.?|[IVX]+\.?)?\s*({SECTION_HEADINGS})\s*:?\s*$", re.I | re.M)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str | None) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def split_sections(text: str) -> dict[str, str]:
+    """
+    Plain PDF text → {"abstract", "introduction", "conclusion", "body"} by heading lines.
+    Text before the first heading counts as body (title block, or an unlabelled abstract);
+    references and acknowledgements are dropped.
+    """
+    out = {"abstract": [], "introduction": [], "conclusion": [], "body": []}
+    current, pos = "body", 0
+    for m in _HEADING_RE.finditer(text or ""):
+        if current:
+            out[current].append(text[pos:m.start()])
+        name = m.group(1).lower()
+        current = SECTION_OF.get(name, "body") if not name.startswith("acknowledg") else None
+        pos = m.end()
+    if current:
+        out[current].append((text or "")[pos:])
+    return {k: re.sub(r"\s+", " ", " ".join(v)).strip() for k, v in out.items()}
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return {tuple(words[i:i + OVERLAP_SHINGLE]) for i in range(max(0, len(words) - OVERLAP_SHINGLE + 1))}
+
+
+def remove_overlap(text: str, reference: str) -> str:
+    """Drop sentences of `text` that mostly repeat `reference` (e.g. a PDF's own abstract vs. the source snippet)."""
+    ref = _shingles(reference)
+    if not ref or not text:
+        return text
+    flat = " ".join(re.findall(r"[a-z0-9]+", reference.lower()))
+    keep = []
+    for sent in _SENTENCE_RE.split(text):
+        sh = _shingles(sent)
+        if sh and len(sh & ref) / len(sh) >= OVERLAP_MIN:
+            continue
+        words = " ".join(re.findall(r"[a-z0-9]+", sent.lower()))
+        if not sh and words and words in flat:  # too short to shingle
+            continue
+        keep.append(sent)
+    return " ".join(keep).strip()
+
+
+def _clip(text: str, tokens: int) -> str:
+    """At most `tokens` (estimated), cut back to a sentence or word boundary."""
+    limit = max(0, tokens) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+    return cut[:end + 1] if end > limit // 2 else cut.rsplit(" ", 1)[0]
+
+
+def fit_paper_text(snippet: str, pdf_text: str, budget: int = PAPER_PROMPT_TOKENS) -> tuple[str, str, dict]:
+    """
+    Fill `budget` tokens in priority order: abstract (source snippet, else the PDF's own), then
+    introduction + conclusion (sharing what is left), then body. PDF sentences that repeat the
+    snippet are removed first. Returns (context, pdf_part, estimated tokens per field).
+    """
+    snippet = (snippet or "").strip()
+    sections = {k: remove_overlap(v, snippet) for k, v in split_sections(pdf_text or "").items()}
+    abstract = snippet or sections["abstract"]
+    if snippet and sections["abstract"]:
+        sections["introduction"] = (sections["abstract"] + " " + sections["introduction"]).strip()  # leftovers
+
+    context = _clip(abstract, budget)
+    left = budget - estimate_tokens(context)
+    intro, concl = sections["introduction"], sections["conclusion"]
+    share = left // 2 if intro and concl else left
+    intro = _clip(intro, max(share, left - estimate_tokens(concl)) if concl else left)
+    concl = _clip(concl, left - estimate_tokens(intro))
+    left -= estimate_tokens(intro) + estimate_tokens(concl)
+    body = _clip(sections["body"], left)
+
+    parts = [(label, t) for label, t in (("Introduction", intro), ("Conclusion", concl), ("Body", body)) if t]
+    pdf_part = "\n".join(f"[{label}] {t}" for label, t in parts)
+    est = {"abstract": estimate_tokens(context), "introduction": estimate_tokens(intro),
+           "conclusion": estimate_tokens(concl), "body": estimate_tokens(body)}
+    return context, pdf_part, est
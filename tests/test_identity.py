@@ -0,0 +1,38 @@
+from identity import IdentityResolver
+
+DISTINCT_PAIRS = [
+    ("Type 1 diabetes mellitus in children", "Type 2 diabetes mellitus in children"),
+    ("Mutations in BRCA1 and hereditary breast cancer risk", "Mutations in BRCA2 and hereditary breast cancer risk"),
+    ("Interleukin-6 signalling in rheumatoid arthritis", "Interleukin-17 signalling in rheumatoid arthritis"),
+    ("Deep learning for protein structure prediction, part I", "Deep learning for protein structure prediction, part II"),
+    ("Discovery of a selective kinase inhibitor 4a", "Discovery of a selective kinase inhibitor 4b"),
+]
+
+
+def _paper(title, **extra):
+    return {"title": title, "year": 2021, **extra}
+
+
+def test_numbered_look_alikes_stay_apart():
+    for a, b in DISTINCT_PAIRS:
+        resolver = IdentityResolver()
+        kept = resolver.extend([_paper(a, doi="10.1000/a"), _paper(b, source="pubmed", pmid="1")])
+        assert len(kept) == 2, (a, b)
+
+
+def test_same_source_records_never_title_merge():
+    pages = [_paper(f"Bulk protein paper {i}", source="s2", s2_id=f"id{i}", url=f"https://s2/{i}") for i in range(50)]
+    pages += [_paper("Protein folding in the crowded cell", source="s2", s2_id="x", url="https://s2/x"),
+              _paper("Protein folding in the crowded cell.", source="s2", s2_id="y", url="https://s2/y")]
+    assert len(IdentityResolver().extend(pages)) == 52
+
+
+def test_cross_source_variants_still_merge():
+    resolver = IdentityResolver()
+    kept = resolver.extend([
+        _paper("Protein folding in the crowded cell: a review", source="s2", s2_id="x", doi="10.1/x"),
+        _paper("Protein folding in the crowded cell - a review.", source="pubmed", pmid="7"),
+        _paper("Deep learning for protein structure prediction, part II", source="s2", s2_id="y"),
+        _paper("Deep Learning for Protein Structure Prediction (Part II)", source="pubmed", pmid="8"),
+    ])
+    assert len(kept) == 2 and resolver.merged == 2
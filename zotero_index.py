@@ -0,0 +1,118 @@
+# zotero_index.py — local duplicate index of a Zotero library, kept current by incremental version sync
+import os
+import re
+import threading
+
+from disk_cache import DiskCache, CACHE_DIR, cache_key
+from identity import normalize_doi, normalize_title
+
+_DOI_RE = re.compile(r"\b10\.\d{4,9}/[^\s\"<>]+", re.I)
+_SKIP_TYPES = {"note", "annotation"}  # child items never count as papers; attachments only for their file md5
+
+_store = DiskCache(os.path.join(CACHE_DIR, "zotero_index.sqlite"))
+
+
+def _item_keys(data: dict) -> tuple[str, str]:
+    """(normalized DOI, normalized title) of a Zotero item's data; the DOI may also sit in url/extra."""
+    doi = normalize_doi(data.get("DOI"))
+    if not doi:
+        m = _DOI_RE.search(f"{data.get('url') or ''} {data.get('extra') or ''}")
+        doi = normalize_doi(m.group(0)) if m else ""
+    return doi, normalize_title(data.get("title"))
+
+
+class ZoteroIndex:
+    """
+    Normalized DOIs and titles of every regular item in one Zotero library, for O(1) duplicate checks,
+    plus the md5 of every stored attachment file.
+    sync() fetches only what changed since the stored library version (`since=`), plus deletions,
+    and persists the result, so later runs start from where the last one stopped.
+    Items in the trash do not count. Safe to share between sessions (one lock around all state).
+    """
+
+    def __init__(self, zot, library_id: str, api_key: str = ""):
+        self.zot = zot
+        self.version = 0
+        self._key = cache_key("zotero-index", library_id, api_key)  # hashed: no API key on disk
+        self._lock = threading.Lock()
+        self._items: dict[str, list[str]] = {}    # item key → [doi, title, md5]
+        self._dois: dict[str, set[str]] = {}      # doi → item keys
+        self._titles: dict[str, set[str]] = {}    # title → item keys
+        self._md5s: dict[str, set[str]] = {}      # attachment file md5 → attachment keys
+        saved = _store.get(self._key)
+        if saved:
+            self.version = saved["version"]
+            for k, entry in saved["items"].items():
+                self._put(k, *entry)
+
+    def _put(self, key: str, doi: str, title: str, md5: str = ""):
+        self._drop(key)
+        self._items[key] = [doi, title, md5]
+        for index, value in ((self._dois, doi), (self._titles, title), (self._md5s, md5)):
+            if value:
+                index.setdefault(value, set()).add(key)
+
+    def _drop(self, key: str):
+        doi, title, md5 = self._items.pop(key, ("", "", ""))
+        for index, value in ((self._dois, doi), (self._titles, title), (self._md5s, md5)):
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+
+    def sync(self) -> int:
+        """Bring the index up to the library's current version; returns the number of items changed or removed."""
+        with self._lock:
+            latest = self.zot.last_modified_version()
+            if latest == self.version:
+                return 0
+            changed = self.zot.everything(self.zot.items(since=self.version, includeTrashed=1))
+            deleted = self.zot.deleted(since=self.version).get("items", []) if self.version else []
+            for it in changed:
+                data = it.get("data", {})
+                if data.get("deleted") or data.get("itemType") in _SKIP_TYPES:
+                    self._drop(it["key"])
+                elif data.get("itemType") == "attachment":
+                    self._put(it["key"], "", "", data.get("md5") or "")
+                else:
+                    self._put(it["key"], *_item_keys(data))
+            for key in deleted:
+                self._drop(key)
+            # items changed while we were fetching are simply fetched again next time
+            self.version = latest
+            _store.set(self._key, {"version": self.version, "items": self._items})
+            return len(changed) + len(deleted)
+
+    def add(self, key: str, data: dict):
+        """Record an item this app just created, so it counts as a duplicate before the next sync."""
+        with self._lock:
+            self._put(key, *_item_keys(data))
+
+    def add_file(self, key: str, md5: str):
+        """Record an attachment this app just uploaded."""
+        with self._lock:
+            self._put(key, "", "", md5)
+
+    def has_file(self, md5: str) -> bool:
+        """Whether any attachment in the library stores a file with this md5."""
+        with self._lock:
+            return bool(md5 and self._md5s.get(md5))
+
+    def keys(self) -> set[str]:
+        """Keys of every item and attachment currently indexed."""
+        with self._lock:
+            return set(self._items)
+
+    def matches(self, title: str | None = None, doi: str | None = None) -> set[str]:
+        """Keys of all items with the same normalized DOI; only when `doi` is empty, with the same title."""
+        doi, title = normalize_doi(doi), normalize_title(title)
+        with self._lock:
+            return set(self._dois.get(doi, ()) if doi else self._titles.get(title, ()) if title else ())
+
+    def find(self, title: str | None = None, doi: str | None = None) -> str | None:
+        """Key of an item with the same normalized DOI or title, else None."""
+        doi, title = normalize_doi(doi), normalize_title(title)
+        with self._lock:
+            keys = (doi and self._dois.get(doi)) or (title and self._titles.get(title))
+            return next(iter(keys)) if keys else None